@@ -1,70 +1,205 @@
+import io
+import os
+
+import pytest
+
+from huffman import MAX_CODE_LENGTH
+from lzw_blocks import LZWArchiveReader, compress_file_parallel, \
+    decompress_file_parallel, read_range
+from lzw_format import MIN_BITS, LIMIT_BITS, FLAG_HUFFMAN, pack_codes, \
+    unpack_codes, read_header, read_lzw, write_lzw
+from lzw_stream import POLICIES, POLICY_ADAPTIVE, LZWDecompressor, \
+    compress_buffer, compress_file, decompress_file
+from main import lzw_compress, lzw_decompress, lzw_compress_fast, \
+    lzw_decompress_fast, lzw_decompress_into
+
+RES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'res')
+EXTENSIONS = sorted(os.path.splitext(file_name)[1]
+                    for file_name in os.listdir(RES_PATH)
+                    if file_name.startswith('file'))
+SMALL_SAMPLES = {
+    'empty': b'',
+    'one-byte': b'a',
+    'repeated': b'ab' * 1000,
+    'tobeornot': b'TOBEORNOTTOBEORTOBEORNOT',
+}
+SAMPLES = list(SMALL_SAMPLES) + EXTENSIONS
+BITS = range(MIN_BITS, LIMIT_BITS + 1)
+# enough of every file to fill a 16-bit table, without timing out the
+# policy x width matrix
+MATRIX_BYTES = 1 << 17
+
+
+def load_sample(name):
+    if name in SMALL_SAMPLES:
+        return SMALL_SAMPLES[name]
+    with open(os.path.join(RES_PATH, f'file{name}'), 'rb') as file:
+        return file.read()
+
+
 class LZW:
+    """Reusable LZW codec over bytes.
+
+    Every call builds its own encoder or decoder state, so one instance
+    can compress and decompress any number of inputs in any order. bits is
+    the maximum code width; at 12 bits the codes match main.lzw_compress.
+    """
+
     def __init__(self, bits=12):
+        if not MIN_BITS <= bits <= LIMIT_BITS:
+            raise ValueError(f'bits must be in [{MIN_BITS}, {LIMIT_BITS}]')
         self.bits = bits
         self.max_code = 2**bits
-        self.reset()
-
-    def reset(self):
-        self.dictionary = {chr(i): i for i in range(256)}
-        self.next_code = 256
 
     def compress(self, data):
-        compressed = []
-        prefix = ""
-
-        for c in data:
-            if isinstance(prefix, int):
-                prefix = str(prefix)
-
-            wc = prefix + str(c)
-
-            if wc in self.dictionary:
-                prefix = wc
-            else:
-                if prefix:
-                    compressed.append(self.dictionary[prefix])
-
-                if len(self.dictionary) < self.max_code:
-                    self.dictionary[wc] = self.next_code
-                    self.next_code += 1
-
-                prefix = c
-
-        if prefix:
-            compressed.append(self.dictionary[prefix])
-
-        return compressed
+        """Return the list of LZW codes for data."""
+        return lzw_compress_fast(data, self.bits)
 
     def decompress(self, compressed):
-        decompressed = ""
-        prefix = ""
-
-        for code in compressed:
-            if code in self.dictionary:
-                entry = self.dictionary[code]
-            else:
-                entry = prefix + prefix[0]
-
-            decompressed += entry
-
-            if len(self.dictionary) < self.max_code:
-                self.dictionary[self.next_code] = prefix + entry[0]
-                self.next_code += 1
-
-            prefix = entry
-
-        return decompressed
-
-
-def test_lzw_compression_2(extensions):
-    for ext in extensions:
-        with open(f"res/file{ext}", "rb") as file:
-            data = file.read()
-        lzw = LZW()
-        compressed = lzw.compress(data)
-        with open(f"com2/compressed{ext}.lzw", "wb") as compressed_file:
-            compressed_file.write(bytes(compressed))
-
-        decompressed = lzw.decompress(compressed)
-        with open(f"decom2/file_decompressed{ext}", "wb") as decompressed_file:
-            decompressed_file.write(decompressed)
+        """Return the bytes for a list of LZW codes."""
+        return bytes(lzw_decompress_fast(compressed, self.bits))
+
+    def encode(self, data):
+        """Compress data into variable-width packed bytes."""
+        return pack_codes(self.compress(data), self.bits)
+
+    def decode(self, data):
+        """Decompress bytes produced by encode."""
+        return self.decompress(unpack_codes(data, self.bits))
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_lzw_compression_2(extension, tmp_path):
+    lzw = LZW()
+    data = load_sample(extension)
+    compressed = lzw.encode(data)
+    compressed_name = tmp_path / f'compressed{extension}.lzw'
+    compressed_name.write_bytes(compressed)
+
+    decompressed = lzw.decode(compressed_name.read_bytes())
+    decompressed_name = tmp_path / f'file_decompressed{extension}'
+    decompressed_name.write_bytes(decompressed)
+    assert decompressed_name.read_bytes() == data
+
+
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_lzw_conformance(sample):
+    """Check LZW against main.lzw_compress/lzw_decompress."""
+    data = load_sample(sample)
+    lzw = LZW()
+    codes = lzw.compress(data)
+    # reusing the instance must not leak state between calls
+    assert lzw.compress(data) == codes
+    if data:
+        assert codes == lzw_compress(data)
+        assert lzw_decompress(codes) == data
+    assert lzw.decompress(codes) == data
+    assert lzw.decode(lzw.encode(data)) == data
+
+
+@pytest.mark.parametrize('bits', BITS)
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_lzw_widths(sample, bits):
+    data = load_sample(sample)
+    lzw = LZW(bits)
+    codes = lzw.compress(data)
+    assert all(code < lzw.max_code for code in codes)
+    assert lzw.decompress(codes) == data
+    assert lzw.decode(lzw.encode(data)) == data
+
+
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_lzw_decompress_into(sample):
+    data = load_sample(sample)
+    codes = lzw_compress_fast(data)
+    buffer = bytearray(len(data))
+    assert lzw_decompress_into(codes, buffer) == len(data)
+    assert buffer == data
+    if data:
+        with pytest.raises(ValueError):
+            lzw_decompress_into(codes, bytearray(len(data) - 1))
+
+
+def _stream_round_trip(data, bits, policy, huffman=False):
+    compressed = io.BytesIO()
+    assert compress_buffer(data, compressed, bits, policy,
+                           chunk_size=1 << 15, huffman=huffman) == len(data)
+    decompressor = LZWDecompressor()
+    assert decompressor.feed(compressed.getvalue()) + \
+        decompressor.flush() == data
+    compressed.seek(0)
+    return read_header(compressed), len(compressed.getvalue())
+
+
+@pytest.mark.parametrize('policy', POLICIES)
+@pytest.mark.parametrize('bits', BITS)
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_lzw_stream(sample, bits, policy):
+    _stream_round_trip(load_sample(sample)[:MATRIX_BYTES], bits, policy)
+
+
+@pytest.mark.parametrize('policy', POLICIES)
+@pytest.mark.parametrize('bits', BITS)
+@pytest.mark.parametrize('sample', SAMPLES)
+def test_lzw_huffman(sample, bits, policy):
+    data = load_sample(sample)[:MATRIX_BYTES]
+    if bits > MAX_CODE_LENGTH:
+        # more codes than 15-bit codewords can tell apart
+        with pytest.raises(ValueError):
+            _stream_round_trip(data, bits, policy, huffman=True)
+        with pytest.raises(ValueError):
+            write_lzw(io.BytesIO(), lzw_compress_fast(data, bits), len(data),
+                      bits, huffman=True)
+        return
+
+    if policy == POLICY_ADAPTIVE:
+        # the ratio checks need an exact bit count as they go
+        with pytest.raises(ValueError):
+            _stream_round_trip(data, bits, policy, huffman=True)
+    else:
+        (max_bits, flags, _), size = _stream_round_trip(data, bits, policy,
+                                                        huffman=True)
+        _, plain_size = _stream_round_trip(data, bits, policy)
+        assert max_bits == bits
+        # Huffman coding is only kept when it wins
+        if flags & FLAG_HUFFMAN:
+            assert size < plain_size
+        else:
+            assert size == plain_size
+
+    codes = lzw_compress_fast(data, bits)
+    compressed = io.BytesIO()
+    write_lzw(compressed, codes, len(data), bits, huffman=True)
+    compressed.seek(0)
+    assert read_lzw(compressed) == (codes, len(data))
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_lzw_file(extension, tmp_path):
+    input_name = os.path.join(RES_PATH, f'file{extension}')
+    compress_file(input_name, tmp_path / 'file.lzw')
+    decompress_file(tmp_path / 'file.lzw', tmp_path / 'file.out')
+    assert (tmp_path / 'file.out').read_bytes() == load_sample(extension)
+
+
+@pytest.mark.parametrize('extension', EXTENSIONS)
+def test_lzw_blocks(extension, tmp_path):
+    data = load_sample(extension)
+    input_name = os.path.join(RES_PATH, f'file{extension}')
+    archive_name = tmp_path / 'file.lzwx'
+    compress_file_parallel(input_name, archive_name, block_size=1 << 16,
+                           workers=2)
+    assert decompress_file_parallel(archive_name, tmp_path / 'file.out',
+                                    workers=2) == len(data)
+    assert (tmp_path / 'file.out').read_bytes() == data
+
+    offset = len(data) // 3
+    assert read_range(archive_name, offset, 1 << 17) == \
+        data[offset:offset + (1 << 17)]
+    with LZWArchiveReader(archive_name) as reader:
+        reader.seek(-100, io.SEEK_END)
+        assert reader.read() == data[-100:]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main([__file__]))
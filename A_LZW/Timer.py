@@ -1,12 +1,47 @@
+import functools
+import json
+import os
+import threading
 import time
+import tracemalloc
+
+from metrics import percentile
+
+
+class Span:
+    """One timed region; use as a context manager or a decorator."""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer._enter(self.name)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer._exit()
+
+    def __call__(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with Span(self.timer, self.name):
+                return function(*args, **kwargs)
+        return wrapper
 
 
 class Timer:
-    def __init__(self):
+    def __init__(self, enabled=True, trace_memory=False):
         self.start_time = None
         self.end_time = None
         self.elapsed_time = None
 
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
     def start(self):
         """Start the timer."""
         self.start_time = time.perf_counter()
@@ -28,4 +63,150 @@ class Timer:
         if elapsed_time is not None:
             print(f"Elapsed time: {elapsed_time:.2f} seconds")
         else:
-            print("Timer was not started.")
\ No newline at end of file
+            print("Timer was not started.")
+
+    def enable(self, trace_memory=False):
+        """Start recording spans, optionally with tracemalloc peaks."""
+        self.enabled = True
+        self.trace_memory = trace_memory
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        """Drop every recorded span."""
+        with self.lock:
+            self.durations = {}
+            self.memory_peaks = {}
+            self.events = []
+            self.origin = time.perf_counter()
+
+    def span(self, name):
+        """Time a named region; nested spans are recorded as parent/child."""
+        return Span(self, name)
+
+    def timed(self, name=None):
+        """Decorator recording every call of a function as a span."""
+        def decorator(function):
+            return Span(self, name or function.__qualname__)(function)
+        return decorator
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def _enter(self, name):
+        stack = self._stack()
+        if not self.enabled:
+            stack.append(None)
+            return
+
+        path = f'{stack[-1]["path"]}/{name}' if stack and stack[-1] else name
+        frame = {'name': name, 'path': path, 'memory': None}
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            if stack and stack[-1] and stack[-1]['memory']:
+                parent = stack[-1]['memory']
+                parent['peak'] = max(parent['peak'], peak)
+            tracemalloc.reset_peak()
+            frame['memory'] = {'base': current, 'peak': current}
+        stack.append(frame)
+        frame['start'] = time.perf_counter()
+
+    def _exit(self):
+        end = time.perf_counter()
+        stack = self._stack()
+        frame = stack.pop()
+        if frame is None:
+            return
+
+        duration = end - frame['start']
+        memory_peak = None
+        if frame['memory'] is not None:
+            _, peak = tracemalloc.get_traced_memory()
+            memory = frame['memory']
+            memory['peak'] = max(memory['peak'], peak)
+            memory_peak = memory['peak'] - memory['base']
+            if stack and stack[-1] and stack[-1]['memory']:
+                parent = stack[-1]['memory']
+                parent['peak'] = max(parent['peak'], memory['peak'])
+            tracemalloc.reset_peak()
+
+        with self.lock:
+            self.durations.setdefault(frame['path'], []).append(duration)
+            if memory_peak is not None:
+                self.memory_peaks[frame['path']] = max(
+                    self.memory_peaks.get(frame['path'], 0), memory_peak)
+            self.events.append((frame['name'], frame['path'],
+                                frame['start'] - self.origin, duration,
+                                threading.get_ident()))
+
+    def summary(self):
+        """Per span path: count, total, min, max, mean and percentiles."""
+        with self.lock:
+            durations = {path: sorted(values)
+                         for path, values in self.durations.items()}
+            memory_peaks = dict(self.memory_peaks)
+
+        summary = {}
+        for path, values in durations.items():
+            summary[path] = {
+                'count': len(values),
+                'total': sum(values),
+                'min': values[0],
+                'max': values[-1],
+                'mean': sum(values) / len(values),
+                'p50': percentile(values, 0.50),
+                'p95': percentile(values, 0.95),
+                'p99': percentile(values, 0.99),
+            }
+            if path in memory_peaks:
+                summary[path]['peak_memory'] = memory_peaks[path]
+        return summary
+
+    def print_summary(self):
+        """Print the span statistics as a table, parents before children."""
+        summary = self.summary()
+        print(f'{"Span":<40}{"Count":>8}{"Total s":>12}{"Mean ms":>10}'
+              f'{"p95 ms":>10}{"Max ms":>10}{"Peak mem":>14}')
+        for path in sorted(summary):
+            stats = summary[path]
+            depth = path.count('/')
+            label = '  ' * depth + path.rsplit('/', 1)[-1]
+            memory = stats.get('peak_memory')
+            print(f'{label:<40}{stats["count"]:>8}{stats["total"]:>12.4f}'
+                  f'{stats["mean"] * 1e3:>10.3f}{stats["p95"] * 1e3:>10.3f}'
+                  f'{stats["max"] * 1e3:>10.3f}'
+                  f'{f"{memory:,} B" if memory is not None else "":>14}')
+
+    def export_json(self, file_name):
+        """Write summary() to a JSON file."""
+        with open(file_name, 'w') as file:
+            json.dump(self.summary(), file, indent=2)
+
+    def export_chrome_trace(self, file_name):
+        """Write every span as a complete event for chrome://tracing."""
+        with self.lock:
+            events = list(self.events)
+        pid = os.getpid()
+        trace_events = [{
+            'name': name,
+            'cat': path.split('/', 1)[0],
+            'ph': 'X',
+            'ts': start * 1e6,
+            'dur': duration * 1e6,
+            'pid': pid,
+            'tid': thread_id,
+            'args': {'path': path},
+        } for name, path, start, duration, thread_id in events]
+        with open(file_name, 'w') as file:
+            json.dump({'traceEvents': trace_events,
+                       'displayTimeUnit': 'ms'}, file)
+
+
+# shared instrumentation for the codec paths; spans are free until enabled
+profiler = Timer(enabled=False)
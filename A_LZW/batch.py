@@ -0,0 +1,149 @@
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+
+from Timer import Timer
+
+# No imports from main here: B_FLIF uses this module and has its own main.
+
+# input bytes being compressed at once; one larger file may still run alone
+MAX_IN_FLIGHT_BYTES = 256 << 20
+
+
+def ordered_map(executor, function, iterable, window):
+    """Like executor.map, but with at most window tasks in flight."""
+    pending = deque()
+    for item in iterable:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def walk_files(folder_path):
+    """Yield (path, path relative to folder_path) of every file below it."""
+    for root, _, file_names in os.walk(folder_path):
+        for file_name in sorted(file_names):
+            path = os.path.join(root, file_name)
+            yield path, os.path.relpath(path, folder_path)
+
+
+def compress_atomically(compress_function, input_filename, output_filename):
+    """Run compress_function into a temporary file, then rename it in place.
+
+    Readers of the output tree never see a partially written file.
+    """
+    timer = Timer()
+    output_folder = os.path.dirname(output_filename) or '.'
+    os.makedirs(output_folder, exist_ok=True)
+    temp_filename = os.path.join(
+        output_folder,
+        f'.{os.path.basename(output_filename)}.{uuid.uuid4().hex}.tmp')
+
+    timer.start()
+    try:
+        compress_function(input_filename, temp_filename)
+        os.replace(temp_filename, output_filename)
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    elapsed_time = timer.stop()
+
+    original_size = os.path.getsize(input_filename)
+    compressed_size = os.path.getsize(output_filename)
+    return {
+        'input': input_filename,
+        'output': output_filename,
+        'original_size': original_size,
+        'compressed_size': compressed_size,
+        'seconds': elapsed_time,
+    }
+
+
+def compress_directory(input_folder, output_folder, compress_function,
+                       output_suffix, executor='process', workers=None,
+                       max_in_flight_bytes=MAX_IN_FLIGHT_BYTES):
+    """Compress every file under input_folder into a mirrored output tree.
+
+    executor is 'process' for pure-Python codecs or 'thread' for codecs
+    that release the GIL (ctypes, PIL). compress_function(input, output)
+    must be picklable for processes. Returns the batch report.
+    """
+    workers = workers or os.cpu_count()
+    executor_class = {'process': ProcessPoolExecutor,
+                      'thread': ThreadPoolExecutor}[executor]
+    results = []
+    errors = []
+    pending = {}
+    in_flight_bytes = 0
+    start_time = time.perf_counter()
+
+    def collect(done):
+        nonlocal in_flight_bytes
+        for future in done:
+            input_filename, size = pending.pop(future)
+            in_flight_bytes -= size
+            try:
+                results.append(future.result())
+            except Exception as error:
+                errors.append({'input': input_filename, 'error': repr(error)})
+
+    with executor_class(workers) as pool:
+        for input_filename, relative_path in walk_files(input_folder):
+            size = os.path.getsize(input_filename)
+            while pending and (len(pending) >= workers * 2 or
+                               in_flight_bytes + size > max_in_flight_bytes):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            output_filename = os.path.join(output_folder,
+                                           relative_path + output_suffix)
+            future = pool.submit(compress_atomically, compress_function,
+                                 input_filename, output_filename)
+            pending[future] = (input_filename, size)
+            in_flight_bytes += size
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    wall_time = time.perf_counter() - start_time
+    original_size = sum(result['original_size'] for result in results)
+    compressed_size = sum(result['compressed_size'] for result in results)
+    return {
+        'files': sorted(results, key=lambda result: result['input']),
+        'errors': errors,
+        'original_size': original_size,
+        'compressed_size': compressed_size,
+        'wall_seconds': wall_time,
+        'busy_seconds': sum(result['seconds'] for result in results),
+    }
+
+
+def print_batch_report(report):
+    print(f'{"File":<40}{"Size":>14}{"Ratio":>8}{"Seconds":>10}{"MB/s":>9}')
+    for result in report['files']:
+        size = result['original_size']
+        ratio = result['compressed_size'] / size if size else 0.0
+        speed = size / result['seconds'] / 1e6 if result['seconds'] else 0.0
+        print(f'{result["input"][-40:]:<40}{size:>14,}{ratio:>8.4f}'
+              f'{result["seconds"]:>10.3f}{speed:>9.2f}')
+    for error in report['errors']:
+        print(f'FAILED {error["input"]}: {error["error"]}')
+
+    print('--------------------------------------------------')
+    size = report['original_size']
+    print(f'Files: \t\t\t{len(report["files"])} ok, '
+          f'{len(report["errors"])} failed')
+    print(f'Original Size: \t\t{size:,} \t bytes')
+    print(f'Compressed Size: \t{report["compressed_size"]:,} \t bytes')
+    if size:
+        print(f'Compression Ratio: \t{report["compressed_size"] / size:.4f}')
+    if report['wall_seconds']:
+        print(f'Throughput: \t\t{size / report["wall_seconds"] / 1e6:.2f} '
+              f'MB/s over {report["wall_seconds"]:.3f} seconds')
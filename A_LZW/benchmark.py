@@ -0,0 +1,296 @@
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+from multiprocessing import Pool
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from Timer import Timer
+from main import lzw_compress, lzw_compress_fast
+from metrics import calculate_compression_ratio, calculate_compression_speed, \
+    calculate_decompression_speed, percentile
+from lzw_stream import LZWCompressor, LZWDecompressor, POLICY_FREEZE
+from lzw_blocks import compress_file_parallel, decompress_file_parallel
+from lzw_format import (CodeWriter, CodeReader, pack_codes, unpack_codes,
+                        pack_codes_fixed, unpack_codes_fixed)
+
+
+def benchmark_compressors(folder_path='res', repeat=3):
+    """Compare compression throughput of lzw_compress and lzw_compress_fast."""
+    timer = Timer()
+    compressors = [('lzw_compress', lzw_compress),
+                   ('lzw_compress_fast', lzw_compress_fast)]
+
+    print(f'{"File":<16}{"Size":>12}' +
+          ''.join(f'{name:>20}' for name, _ in compressors) + f'{"Speedup":>10}')
+    for file_name in sorted(os.listdir(folder_path)):
+        with open(os.path.join(folder_path, file_name), 'rb') as file:
+            data = file.read()
+
+        speeds = []
+        reference = None
+        for _, compress in compressors:
+            best_time = None
+            for _ in range(repeat):
+                timer.start()
+                codes = compress(data)
+                elapsed_time = timer.stop()
+                if best_time is None or elapsed_time < best_time:
+                    best_time = elapsed_time
+            if reference is None:
+                reference = codes
+            elif codes != reference:
+                raise AssertionError(f'{file_name}: code streams differ')
+            speeds.append(calculate_compression_speed(len(data), best_time))
+
+        print(f'{file_name:<16}{len(data):>12,}' +
+              ''.join(f'{speed / 1e6:>15.2f} MB/s' for speed in speeds) +
+              f'{speeds[-1] / speeds[0]:>9.2f}x')
+
+
+def benchmark_parallel(folder_path='res', block_size=1 << 18, max_workers=None):
+    """Report block-parallel throughput for 1, 2, 4, ... worker processes."""
+    timer = Timer()
+    max_workers = max_workers or os.cpu_count()
+    worker_counts = []
+    workers = 1
+    while workers < max_workers:
+        worker_counts.append(workers)
+        workers *= 2
+    worker_counts.append(max_workers)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        compressed_filename = os.path.join(temp_dir, 'file.lzwx')
+        decompressed_filename = os.path.join(temp_dir, 'file.out')
+
+        print(f'{"File":<16}{"Workers":>8}{"Compress":>16}'
+              f'{"Decompress":>16}{"Scaling":>10}')
+        for file_name in sorted(os.listdir(folder_path)):
+            input_filename = os.path.join(folder_path, file_name)
+            original_size = os.path.getsize(input_filename)
+            base_speed = None
+            for workers in worker_counts:
+                timer.start()
+                compress_file_parallel(input_filename, compressed_filename,
+                                       block_size, workers)
+                compression_speed = calculate_compression_speed(
+                    original_size, timer.stop())
+
+                timer.start()
+                decompressed_size = decompress_file_parallel(
+                    compressed_filename, decompressed_filename, workers)
+                decompression_speed = calculate_decompression_speed(
+                    decompressed_size, timer.stop())
+
+                base_speed = base_speed or compression_speed
+                print(f'{file_name:<16}{workers:>8}'
+                      f'{compression_speed / 1e6:>11.2f} MB/s'
+                      f'{decompression_speed / 1e6:>11.2f} MB/s'
+                      f'{compression_speed / base_speed:>9.2f}x')
+
+
+def _write_per_code(codes):
+    file = io.BytesIO()
+    for code in codes:
+        file.write(code.to_bytes(2, byteorder='big'))
+    return file.getvalue()
+
+
+def _read_per_code(data):
+    return [int.from_bytes(data[i:i + 2], byteorder='big')
+            for i in range(0, len(data), 2)]
+
+
+def _write_code_by_code(codes):
+    writer = CodeWriter()
+    writer.write(codes)
+    return writer.flush()
+
+
+def benchmark_packing(folder_path='res', repeat=3):
+    """Compare per-code packing loops with the bulk pack/unpack functions."""
+    timer = Timer()
+    methods = [
+        ('16-bit per code', _write_per_code, _read_per_code),
+        ('16-bit bulk', pack_codes_fixed, unpack_codes_fixed),
+        ('var-width per code', _write_code_by_code,
+         lambda data: CodeReader().read(data)),
+        ('var-width bulk', pack_codes, unpack_codes),
+    ]
+
+    print(f'{"File":<16}{"Method":<20}{"Pack":>16}{"Unpack":>16}')
+    for file_name in sorted(os.listdir(folder_path)):
+        with open(os.path.join(folder_path, file_name), 'rb') as file:
+            codes = lzw_compress_fast(file.read())
+
+        for name, pack, unpack in methods:
+            pack_time = unpack_time = None
+            for _ in range(repeat):
+                timer.start()
+                packed = pack(codes)
+                elapsed_time = timer.stop()
+                pack_time = min(pack_time or elapsed_time, elapsed_time)
+
+                timer.start()
+                unpacked = unpack(packed)
+                elapsed_time = timer.stop()
+                unpack_time = min(unpack_time or elapsed_time, elapsed_time)
+            if unpacked != codes:
+                raise AssertionError(f'{file_name}: {name} round trip failed')
+
+            print(f'{file_name:<16}{name:<20}'
+                  f'{len(codes) / pack_time / 1e6:>9.2f} Mcode/s'
+                  f'{len(codes) / unpack_time / 1e6:>9.2f} Mcode/s')
+
+
+def discover_corpus(folder_path):
+    """Return the sorted regular files directly inside folder_path."""
+    return sorted(os.path.join(folder_path, file_name)
+                  for file_name in os.listdir(folder_path)
+                  if os.path.isfile(os.path.join(folder_path, file_name)))
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KiB elsewhere
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def benchmark_file(input_filename, repeat=5, warmup=1, max_bits=12,
+                   policy=POLICY_FREEZE):
+    """Time warmup + repeat compress/decompress rounds of one file."""
+    timer = Timer()
+    with open(input_filename, 'rb') as file:
+        data = file.read()
+    original_size = len(data)
+
+    compress_times = []
+    decompress_times = []
+    for round_number in range(warmup + repeat):
+        timer.start()
+        compressor = LZWCompressor(max_bits, policy)
+        compressed = compressor.feed(data) + compressor.flush()
+        compress_time = timer.stop()
+
+        timer.start()
+        decompressor = LZWDecompressor()
+        decompressed = decompressor.feed(compressed) + decompressor.flush()
+        decompress_time = timer.stop()
+
+        if decompressed != data:
+            raise ValueError(f'{input_filename}: round trip mismatch')
+        if round_number >= warmup:
+            compress_times.append(compress_time)
+            decompress_times.append(decompress_time)
+
+    def speeds(times, speed):
+        # the p95 is the throughput of the p95 (slow tail) run time
+        return {
+            'median': speed(original_size, statistics.median(times)) / 1e6,
+            'p95': speed(original_size, percentile(times, 0.95)) / 1e6,
+        }
+
+    return {
+        'file': os.path.basename(input_filename),
+        'original_size': original_size,
+        'compressed_size': len(compressed),
+        'ratio': calculate_compression_ratio(original_size, len(compressed))
+        if original_size else None,
+        'compress_mbps': speeds(compress_times, calculate_compression_speed),
+        'decompress_mbps': speeds(decompress_times,
+                                  calculate_decompression_speed),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def _benchmark_file_task(arguments):
+    return benchmark_file(*arguments)
+
+
+def run_benchmark(folder_path='res', repeat=5, warmup=1, max_bits=12,
+                  policy=POLICY_FREEZE):
+    """Benchmark every file of a corpus, each in a fresh worker process.
+
+    A fresh process per file keeps the reported peak RSS specific to it.
+    """
+    tasks = [(input_filename, repeat, warmup, max_bits, policy)
+             for input_filename in discover_corpus(folder_path)]
+    with Pool(1, maxtasksperchild=1) as pool:
+        files = pool.map(_benchmark_file_task, tasks, chunksize=1)
+    return {
+        'settings': {'corpus': folder_path, 'repeat': repeat,
+                     'warmup': warmup, 'max_bits': max_bits,
+                     'policy': policy},
+        'files': files,
+    }
+
+
+def print_results(results):
+    print(f'{"File":<16}{"Size":>12}{"Ratio":>8}'
+          f'{"Comp med":>11}{"Comp p95":>11}'
+          f'{"Decomp med":>12}{"Decomp p95":>12}{"Peak RSS":>12}')
+    for result in results['files']:
+        ratio = result['ratio']
+        rss = result['peak_rss_kb']
+        print(f'{result["file"]:<16}{result["original_size"]:>12,}'
+              f'{ratio if ratio is not None else float("nan"):>8.4f}'
+              f'{result["compress_mbps"]["median"]:>11.2f}'
+              f'{result["compress_mbps"]["p95"]:>11.2f}'
+              f'{result["decompress_mbps"]["median"]:>12.2f}'
+              f'{result["decompress_mbps"]["p95"]:>12.2f}'
+              f'{f"{rss:,} KiB" if rss is not None else "n/a":>12}')
+    print('(throughput in MB/s)')
+
+
+def save_results(results, output_filename):
+    with open(output_filename, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(input_filename):
+    with open(input_filename) as file:
+        return json.load(file)
+
+
+def compare_results(baseline, current, threshold=0.05):
+    """Return regression messages of current against baseline.
+
+    Median throughput dropping, or the ratio growing, by more than
+    threshold (a fraction) counts as a regression.
+    """
+    regressions = []
+    baseline_files = {result['file']: result for result in baseline['files']}
+    for result in current['files']:
+        old = baseline_files.get(result['file'])
+        if old is None:
+            continue
+        for key in ('compress_mbps', 'decompress_mbps'):
+            before = old[key]['median']
+            after = result[key]['median']
+            if after < before * (1 - threshold):
+                regressions.append(
+                    f'{result["file"]}: {key} median {before:.2f} -> '
+                    f'{after:.2f} ({after / before - 1:+.1%})')
+        if old['ratio'] and result['ratio'] and \
+                result['ratio'] > old['ratio'] * (1 + threshold):
+            regressions.append(
+                f'{result["file"]}: ratio {old["ratio"]:.4f} -> '
+                f'{result["ratio"]:.4f}')
+    return regressions
+
+
+if __name__ == "__main__":
+    benchmark_compressors(*sys.argv[1:2])
+    print()
+    benchmark_parallel(*sys.argv[1:2])
+    print()
+    benchmark_packing(*sys.argv[1:2])
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+# bump when a codec's output format changes so stale entries are ignored
+CACHE_VERSION = 1
+CACHE_FOLDER = '.compression_cache'
+MAX_CACHE_SIZE = 1 << 30
+HASH_CHUNK_SIZE = 1 << 20
+
+
+class CompressionCache:
+    """On-disk cache of compressed outputs, addressed by content hash.
+
+    The key covers the input bytes, the codec name and its parameters, so
+    a hit can only return output that the same settings produced from the
+    same input. Entries are evicted least recently used first once the
+    folder grows beyond max_size bytes.
+    """
+
+    def __init__(self, folder_path=CACHE_FOLDER, max_size=MAX_CACHE_SIZE):
+        self.folder_path = folder_path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(input_filename, codec, **parameters):
+        digest = hashlib.sha256()
+        digest.update(json.dumps(
+            [CACHE_VERSION, codec, parameters], sort_keys=True,
+            default=repr).encode('utf-8'))
+        with open(input_filename, 'rb') as file:
+            while True:
+                chunk = file.read(HASH_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.folder_path, key[:2], key)
+
+    def fetch(self, key, output_filename):
+        """Copy a cached entry to output_filename; False on a miss."""
+        path = self.path(key)
+        try:
+            shutil.copyfile(path, output_filename)
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, filename):
+        """Add a copy of filename under key, then evict if over budget."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+        try:
+            shutil.copyfile(filename, temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.evict()
+
+    def entries(self):
+        """Return [(last use, size, path)] of every cached entry."""
+        entries = []
+        for root, _, file_names in os.walk(self.folder_path):
+            for file_name in file_names:
+                if file_name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, file_name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def evict(self):
+        """Delete least recently used entries until within max_size."""
+        entries = sorted(self.entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+    def compress(self, compress_function, input_filename, output_filename,
+                 codec, **parameters):
+        """Run compress_function(input, output) unless the output is cached.
+
+        Returns True on a cache hit.
+        """
+        key = self.key(input_filename, codec, **parameters)
+        if self.fetch(key, output_filename):
+            return True
+        compress_function(input_filename, output_filename)
+        self.store(key, output_filename)
+        return False
@@ -0,0 +1,322 @@
+import heapq
+import struct
+
+from lzw_format import np, pack_bits_numpy
+
+# codes per block; every block carries its own canonical Huffman table
+BLOCK_CODES = 1 << 16
+# codes per lane; a block of n codes is split into ceil(n / LANE_CODES) lanes
+LANE_CODES = 256
+# longest codeword, so one lookup in a 2 ** MAX_CODE_LENGTH table decodes
+MAX_CODE_LENGTH = 15
+# code count, table symbol count, payload length
+BLOCK_HEADER = struct.Struct('>III')
+
+
+def code_lengths(counts, limit=MAX_CODE_LENGTH):
+    """Huffman codeword length per symbol (0 for unused), at most limit.
+
+    Over-long trees are rebuilt from halved counts until they fit, which
+    flattens the rare tail and costs a fraction of a percent. That only
+    ends if 2 ** limit codewords are enough for the used symbols.
+    """
+    symbols = [symbol for symbol, count in enumerate(counts) if count]
+    if len(symbols) > 1 << limit:
+        raise ValueError(f'{len(symbols)} symbols do not fit in '
+                         f'{limit}-bit codewords')
+    lengths = [0] * len(counts)
+    if len(symbols) == 1:
+        lengths[symbols[0]] = 1
+        return lengths
+
+    while True:
+        heap = [(counts[symbol], symbol) for symbol in symbols]
+        heapq.heapify(heap)
+        parents = {}
+        node = len(counts)
+        while len(heap) > 1:
+            count_a, a = heapq.heappop(heap)
+            count_b, b = heapq.heappop(heap)
+            parents[a] = parents[b] = node
+            heapq.heappush(heap, (count_a + count_b, node))
+            node += 1
+
+        # parents are created after their children, so walk them backwards
+        depth = {heap[0][1]: 0}
+        for child in sorted(parents, reverse=True):
+            depth[child] = depth[parents[child]] + 1
+        if max(depth[symbol] for symbol in symbols) <= limit:
+            for symbol in symbols:
+                lengths[symbol] = depth[symbol]
+            return lengths
+        counts = [(count + 1) >> 1 for count in counts]
+
+
+def canonical_codes(lengths):
+    """Canonical codeword per symbol: shorter first, then by symbol."""
+    codewords = [0] * len(lengths)
+    code = 0
+    previous_length = 0
+    for length, symbol in sorted((length, symbol)
+                                 for symbol, length in enumerate(lengths)
+                                 if length):
+        code <<= length - previous_length
+        codewords[symbol] = code
+        code += 1
+        previous_length = length
+    return codewords
+
+
+def decoding_table(lengths):
+    """Entry (symbol << 4) | length for every MAX_CODE_LENGTH-bit prefix."""
+    if np is not None:
+        # canonical codewords fill the table in (length, symbol) order
+        lengths = np.asarray(lengths, dtype=np.int64)
+        used = np.flatnonzero(lengths)
+        used = used[np.argsort(lengths[used], kind='stable')]
+        filled = np.repeat((used << 4) | lengths[used],
+                           1 << (MAX_CODE_LENGTH - lengths[used]))
+        table = np.zeros(1 << MAX_CODE_LENGTH, dtype=np.int64)
+        table[:len(filled)] = filled
+        return table
+
+    table = [0] * (1 << MAX_CODE_LENGTH)
+    for symbol, codeword in enumerate(canonical_codes(lengths)):
+        length = lengths[symbol]
+        if length:
+            shift = MAX_CODE_LENGTH - length
+            start = codeword << shift
+            table[start:start + (1 << shift)] = \
+                [(symbol << 4) | length] * (1 << shift)
+    return table
+
+
+def _pack_lengths(lengths):
+    if len(lengths) & 1:
+        lengths = lengths + [0]
+    return bytes((lengths[i] << 4) | lengths[i + 1]
+                 for i in range(0, len(lengths), 2))
+
+
+def _unpack_lengths(data, symbol_count):
+    if np is not None:
+        packed = np.frombuffer(bytes(data), dtype=np.uint8)
+        return np.stack((packed >> 4, packed & 15), axis=1).ravel()[:symbol_count]
+    lengths = []
+    for byte in data:
+        lengths.append(byte >> 4)
+        lengths.append(byte & 15)
+    return lengths[:symbol_count]
+
+
+def lane_count(count):
+    return max(1, -(-count // LANE_CODES))
+
+
+def _pack_lane(codes, lengths, codewords):
+    payload = bytearray()
+    bit_buffer = bit_count = 0
+    for code in codes:
+        bit_buffer = (bit_buffer << lengths[code]) | codewords[code]
+        bit_count += lengths[code]
+        while bit_count >= 8:
+            bit_count -= 8
+            payload.append((bit_buffer >> bit_count) & 0xFF)
+        bit_buffer &= (1 << bit_count) - 1
+    if bit_count:
+        payload.append((bit_buffer << (8 - bit_count)) & 0xFF)
+    return bytes(payload)
+
+
+def _pack_lanes_numpy(codes, lengths, codewords, lanes):
+    # lane-major order, with zero bits padding every lane to a whole byte
+    order = np.concatenate([np.arange(lane, len(codes), lanes)
+                            for lane in range(lanes)])
+    widths = np.asarray(lengths)[codes[order]]
+    values = np.asarray(codewords)[codes[order]]
+    lane_ends = np.cumsum([len(range(lane, len(codes), lanes))
+                           for lane in range(lanes)])
+    lane_bits = np.add.reduceat(widths, np.r_[0, lane_ends[:-1]])
+    padding = -lane_bits % 8
+    padded = padding > 0
+    values = np.insert(values, lane_ends[padded], 0)
+    widths = np.insert(widths, lane_ends[padded], padding[padded])
+    return pack_bits_numpy(values, widths), ((lane_bits + padding) >> 3).tolist()
+
+
+def encode_block(codes):
+    """One block: header, nibble-packed code lengths, lane sizes, lanes.
+
+    Code i goes to lane i % lanes; every lane is packed on its own so the
+    decoder can step through all of them at once.
+    """
+    lanes = lane_count(len(codes))
+    if np is not None:
+        codes = np.fromiter(codes, dtype=np.int64, count=len(codes))
+        counts = np.bincount(codes).tolist()
+    else:
+        counts = [0] * (max(codes) + 1)
+        for code in codes:
+            counts[code] += 1
+
+    lengths = code_lengths(counts)
+    codewords = canonical_codes(lengths)
+    if np is not None:
+        payload, lane_sizes = _pack_lanes_numpy(codes, lengths, codewords,
+                                                lanes)
+    else:
+        packed = [_pack_lane(codes[lane::lanes], lengths, codewords)
+                  for lane in range(lanes)]
+        payload = b''.join(packed)
+        lane_sizes = [len(lane) for lane in packed]
+
+    return (BLOCK_HEADER.pack(len(codes), len(counts), len(payload)) +
+            _pack_lengths(lengths) +
+            struct.pack(f'>{lanes}H', *lane_sizes) + payload)
+
+
+def _decode_lane(table, data, position, count):
+    codes = []
+    append = codes.append
+    bit_buffer = 0
+    bit_count = 0
+
+    for _ in range(count):
+        if bit_count < MAX_CODE_LENGTH:
+            # two bytes at a time keep at least 15 bits in the buffer; bits
+            # above bit_count are stale and masked off here and on lookup
+            bit_buffer = (((bit_buffer & ((1 << bit_count) - 1)) << 16) |
+                          (data[position] << 8) | data[position + 1])
+            bit_count += 16
+            position += 2
+        entry = table[(bit_buffer >> (bit_count - MAX_CODE_LENGTH)) & 0x7FFF]
+        bit_count -= entry & 15
+        append(entry >> 4)
+    return codes
+
+
+def _decode_lanes_numpy(table, data, lane_starts, count):
+    lanes = len(lane_starts)
+    steps = -(-count // lanes)
+    padded = np.frombuffer(bytes(data) + b'\0\0\0', dtype=np.uint8)
+    padded = padded.astype(np.int64)
+    # the 24 bits starting at every byte, so any codeword is one gather away
+    windows = (padded[:-2] << 16) | (padded[1:-1] << 8) | padded[2:]
+    bit_positions = np.asarray(lane_starts, dtype=np.int64) * 8
+    output = np.empty((steps, lanes), dtype=np.int64)
+
+    # one table lookup per lane per step; the short last step decodes
+    # padding in the unused lanes, which is dropped below
+    for step in range(steps):
+        entries = table[(windows[bit_positions >> 3] >>
+                         (24 - MAX_CODE_LENGTH - (bit_positions & 7))) & 0x7FFF]
+        output[step] = entries
+        bit_positions += entries & 15
+    return (output.ravel()[:count] >> 4).tolist()
+
+
+def decode_block(lengths, lane_sizes, payload, count):
+    """Decode count codes with one table lookup per code.
+
+    With NumPy every step looks up one code in each lane at once, which
+    keeps decoding a small fraction of the LZW dictionary work.
+    """
+    table = decoding_table(lengths)
+    lane_starts = [0]
+    for size in lane_sizes[:-1]:
+        lane_starts.append(lane_starts[-1] + size)
+    if np is not None:
+        return _decode_lanes_numpy(table, payload, lane_starts, count)
+
+    lanes = len(lane_sizes)
+    data = bytes(payload) + b'\0\0\0\0'
+    codes = [0] * count
+    for lane, start in enumerate(lane_starts):
+        codes[lane::lanes] = _decode_lane(table, data, start,
+                                          len(range(lane, count, lanes)))
+    return codes
+
+
+class HuffmanWriter:
+    """Entropy-code LZW codes in blocks of BLOCK_CODES.
+
+    Has the write/take/flush interface of CodeWriter, so the compressor
+    can use either.
+    """
+
+    def __init__(self, block_codes=BLOCK_CODES):
+        self.block_codes = block_codes
+        self.pending = []
+        self.output = bytearray()
+        self.bytes_taken = 0
+
+    def write(self, codes):
+        pending = self.pending
+        pending.extend(codes)
+        if len(pending) >= self.block_codes:
+            full = len(pending) - len(pending) % self.block_codes
+            for start in range(0, full, self.block_codes):
+                self.output += encode_block(
+                    pending[start:start + self.block_codes])
+            del pending[:full]
+
+    def take(self):
+        data = bytes(self.output)
+        self.bytes_taken += len(data)
+        self.output.clear()
+        return data
+
+    def flush(self):
+        if self.pending:
+            self.output += encode_block(self.pending)
+            self.pending = []
+        return self.take()
+
+
+class HuffmanReader:
+    """Decode the blocks of a HuffmanWriter stream, split across chunks."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def read(self, data):
+        """Return the codes of every block completed by data."""
+        buffer = self.buffer
+        buffer += data
+        codes = []
+        start = 0
+        while len(buffer) - start >= BLOCK_HEADER.size:
+            count, symbol_count, payload_length = \
+                BLOCK_HEADER.unpack_from(buffer, start)
+            lanes = lane_count(count)
+            table_start = start + BLOCK_HEADER.size
+            lanes_start = table_start + (symbol_count + 1) // 2
+            payload_start = lanes_start + 2 * lanes
+            end = payload_start + payload_length
+            if len(buffer) < end:
+                break
+            lengths = _unpack_lengths(buffer[table_start:lanes_start],
+                                      symbol_count)
+            lane_sizes = struct.unpack_from(f'>{lanes}H', buffer, lanes_start)
+            codes += decode_block(lengths, lane_sizes,
+                                  buffer[payload_start:end], count)
+            start = end
+        del buffer[:start]
+        return codes
+
+    def finish(self):
+        if self.buffer:
+            raise ValueError('Truncated Huffman block')
+
+
+def encode_codes(codes, block_codes=BLOCK_CODES):
+    writer = HuffmanWriter(block_codes)
+    writer.write(codes)
+    return writer.flush()
+
+
+def decode_codes(data):
+    reader = HuffmanReader()
+    codes = reader.read(data)
+    reader.finish()
+    return codes
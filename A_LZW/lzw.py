@@ -0,0 +1,132 @@
+import argparse
+import sys
+
+from Timer import profiler
+from lzw_format import MAX_BITS
+from lzw_stream import POLICIES, POLICY_FREEZE, compress_file, decompress_file
+
+
+def bench(arguments):
+    from benchmark import run_benchmark, print_results, save_results
+
+    results = run_benchmark(arguments.corpus, arguments.repeat,
+                            arguments.warmup, arguments.max_bits,
+                            arguments.policy)
+    print_results(results)
+    if arguments.json:
+        save_results(results, arguments.json)
+    return 0
+
+
+def compare(arguments):
+    from benchmark import load_results, compare_results
+
+    regressions = compare_results(load_results(arguments.baseline),
+                                  load_results(arguments.current),
+                                  arguments.threshold)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+    if not regressions:
+        print('No regressions')
+    return 1 if regressions else 0
+
+
+def start_profile(arguments):
+    if arguments.profile or arguments.trace:
+        profiler.enable(arguments.trace_memory)
+
+
+def finish_profile(arguments):
+    if not profiler.enabled:
+        return
+    profiler.print_summary()
+    if arguments.profile:
+        profiler.export_json(arguments.profile)
+    if arguments.trace:
+        profiler.export_chrome_trace(arguments.trace)
+
+
+def compress(arguments):
+    start_profile(arguments)
+    with profiler.span('compress_file'):
+        compress_file(arguments.input, arguments.output, arguments.max_bits,
+                      arguments.policy, huffman=arguments.huffman)
+    finish_profile(arguments)
+    return 0
+
+
+def decompress(arguments):
+    start_profile(arguments)
+    with profiler.span('decompress_file'):
+        decompress_file(arguments.input, arguments.output)
+    finish_profile(arguments)
+    return 0
+
+
+def batch(arguments):
+    from batch import compress_directory, print_batch_report
+
+    report = compress_directory(arguments.input, arguments.output,
+                                compress_file, '.lzw', 'process',
+                                arguments.workers,
+                                arguments.max_in_flight << 20)
+    print_batch_report(report)
+    return 1 if report['errors'] else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='lzw')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    parser_bench = commands.add_parser(
+        'bench', help='benchmark every file of a corpus directory')
+    parser_bench.add_argument('corpus', nargs='?', default='res')
+    parser_bench.add_argument('--repeat', type=int, default=5)
+    parser_bench.add_argument('--warmup', type=int, default=1)
+    parser_bench.add_argument('--max-bits', type=int, default=MAX_BITS)
+    parser_bench.add_argument('--policy', choices=POLICIES,
+                              default=POLICY_FREEZE)
+    parser_bench.add_argument('--json', help='save results to this file')
+    parser_bench.set_defaults(handler=bench)
+
+    parser_compare = commands.add_parser(
+        'compare', help='flag regressions between two saved bench results')
+    parser_compare.add_argument('baseline')
+    parser_compare.add_argument('current')
+    parser_compare.add_argument('--threshold', type=float, default=0.05)
+    parser_compare.set_defaults(handler=compare)
+
+    parser_batch = commands.add_parser(
+        'batch', help='compress a whole directory tree in parallel')
+    parser_batch.add_argument('input')
+    parser_batch.add_argument('output')
+    parser_batch.add_argument('--workers', type=int)
+    parser_batch.add_argument('--max-in-flight', type=int, default=256,
+                              help='MiB of input compressed at once')
+    parser_batch.set_defaults(handler=batch)
+
+    for name, handler in (('compress', compress), ('decompress', decompress)):
+        parser_codec = commands.add_parser(name, help=f'{name} one file')
+        parser_codec.add_argument('input')
+        parser_codec.add_argument('output')
+        if handler is compress:
+            parser_codec.add_argument('--max-bits', type=int, default=MAX_BITS)
+            parser_codec.add_argument('--policy', choices=POLICIES,
+                                      default=POLICY_FREEZE)
+            parser_codec.add_argument(
+                '--huffman', action='store_true',
+                help='entropy-code the LZW codes when that is smaller')
+        parser_codec.add_argument('--profile',
+                                  help='save span statistics as JSON')
+        parser_codec.add_argument('--trace',
+                                  help='save a Chrome trace (chrome://tracing)')
+        parser_codec.add_argument('--trace-memory', action='store_true',
+                                  help='record tracemalloc peaks per span')
+        parser_codec.set_defaults(handler=handler)
+
+    arguments = parser.parse_args(argv)
+    return arguments.handler(arguments)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import io
+import os
+import struct
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import ordered_map
+from lzw_format import MAX_BITS, pack_codes, unpack_codes
+from main import lzw_compress_fast, lzw_decompress_fast
+
+# magic, version, max bits, block size
+CONTAINER_HEADER = struct.Struct('>4sBBI')
+# offset, compressed length, raw length
+INDEX_ENTRY = struct.Struct('>QII')
+# index offset, block count, magic
+CONTAINER_FOOTER = struct.Struct('>QI4s')
+CONTAINER_MAGIC = b'LZWX'
+CONTAINER_VERSION = 1
+
+BLOCK_SIZE = 1 << 20
+
+
+def compress_block(block):
+    """Compress one independent block; return (raw length, packed codes)."""
+    return len(block), pack_codes(lzw_compress_fast(block), MAX_BITS)
+
+
+def decompress_block(payload):
+    codes = unpack_codes(payload, MAX_BITS)
+    return lzw_decompress_fast(codes)
+
+
+def _read_blocks(file, block_size):
+    while True:
+        block = file.read(block_size)
+        if not block:
+            break
+        yield block
+
+
+def read_index(file):
+    """Return (block_size, [(offset, compressed length, raw length), ...])."""
+    file.seek(0)
+    magic, version, max_bits, block_size = CONTAINER_HEADER.unpack(
+        file.read(CONTAINER_HEADER.size))
+    if magic != CONTAINER_MAGIC:
+        raise ValueError(f'Not a block LZW container (magic {magic!r})')
+    if version != CONTAINER_VERSION or max_bits != MAX_BITS:
+        raise ValueError(f'Unsupported block container version {version}')
+
+    file.seek(-CONTAINER_FOOTER.size, os.SEEK_END)
+    index_offset, block_count, magic = CONTAINER_FOOTER.unpack(
+        file.read(CONTAINER_FOOTER.size))
+    if magic != CONTAINER_MAGIC:
+        raise ValueError('Block LZW container footer is corrupt')
+
+    file.seek(index_offset)
+    index = [INDEX_ENTRY.unpack(file.read(INDEX_ENTRY.size))
+             for _ in range(block_count)]
+    return block_size, index
+
+
+def compress_file_parallel(input_filename, output_filename,
+                           block_size=BLOCK_SIZE, workers=None):
+    """Compress fixed-size blocks independently across a process pool.
+
+    The container is a header, the packed blocks and a footer index so
+    blocks can also be decompressed in parallel or individually.
+    """
+    workers = workers or os.cpu_count()
+    index = []
+
+    with open(input_filename, 'rb') as file, \
+            open(output_filename, 'wb') as compressed_file, \
+            ProcessPoolExecutor(workers) as executor:
+        compressed_file.write(CONTAINER_HEADER.pack(
+            CONTAINER_MAGIC, CONTAINER_VERSION, MAX_BITS, block_size))
+
+        for raw_length, payload in ordered_map(
+                executor, compress_block,
+                _read_blocks(file, block_size), workers * 2):
+            index.append((compressed_file.tell(), len(payload), raw_length))
+            compressed_file.write(payload)
+
+        index_offset = compressed_file.tell()
+        for entry in index:
+            compressed_file.write(INDEX_ENTRY.pack(*entry))
+        compressed_file.write(CONTAINER_FOOTER.pack(
+            index_offset, len(index), CONTAINER_MAGIC))
+
+    return index
+
+
+def decompress_file_parallel(input_filename, output_filename, workers=None):
+    """Decompress a block container, fanning blocks out across processes."""
+    workers = workers or os.cpu_count()
+
+    with open(input_filename, 'rb') as compressed_file, \
+            open(output_filename, 'wb') as file, \
+            ProcessPoolExecutor(workers) as executor:
+        _, index = read_index(compressed_file)
+
+        def payloads():
+            for offset, compressed_length, _ in index:
+                compressed_file.seek(offset)
+                yield compressed_file.read(compressed_length)
+
+        for (_, _, raw_length), block in zip(
+                index, ordered_map(executor, decompress_block,
+                                    payloads(), workers * 2)):
+            if len(block) != raw_length:
+                raise ValueError(f'Block expected {raw_length} bytes, '
+                                 f'got {len(block)}')
+            file.write(block)
+
+    return sum(raw_length for _, _, raw_length in index)
+
+
+class LZWArchiveReader(io.RawIOBase):
+    """Seekable, read-only file object over a block LZW container.
+
+    Only the blocks overlapping each read are decompressed, and the last
+    decoded block is kept for the next sequential read.
+    """
+
+    def __init__(self, file):
+        super().__init__()
+        if isinstance(file, (str, bytes, os.PathLike)):
+            file = open(file, 'rb')
+            self.owns_file = True
+        else:
+            self.owns_file = False
+        self.file = file
+        self.block_size, self.index = read_index(file)
+
+        self.block_starts = []
+        start = 0
+        for _, _, raw_length in self.index:
+            self.block_starts.append(start)
+            start += raw_length
+        self.length = start
+
+        self.position = 0
+        self.cached_block = None
+        self.cached_data = None
+
+    def close(self):
+        if not self.closed and self.owns_file:
+            self.file.close()
+        super().close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.length + offset
+        else:
+            raise ValueError(f'Invalid whence {whence}')
+        if position < 0:
+            raise ValueError(f'Negative seek position {position}')
+        self.position = position
+        return position
+
+    def _block(self, block_number):
+        if block_number != self.cached_block:
+            offset, compressed_length, raw_length = self.index[block_number]
+            self.file.seek(offset)
+            data = decompress_block(self.file.read(compressed_length))
+            if len(data) != raw_length:
+                raise ValueError(f'Block {block_number} expected {raw_length} '
+                                 f'bytes, got {len(data)}')
+            self.cached_block = block_number
+            self.cached_data = data
+        return self.cached_data
+
+    def read(self, size=-1):
+        """Read up to size bytes from the current position."""
+        end = self.length if size is None or size < 0 else \
+            min(self.length, self.position + size)
+        parts = []
+        while self.position < end:
+            block_number = bisect_right(self.block_starts, self.position) - 1
+            start = self.block_starts[block_number]
+            data = self._block(block_number)
+            part = data[self.position - start:end - start]
+            parts.append(part)
+            self.position += len(part)
+        return b''.join(parts)
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_range(filename, offset, length):
+    """Decompress length bytes at offset from a block LZW container."""
+    with LZWArchiveReader(filename) as reader:
+        reader.seek(offset)
+        return reader.read(length)
@@ -0,0 +1,310 @@
+import struct
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# magic, version, max bits, flags, original length
+HEADER = struct.Struct('>4sBBBQ')
+MAGIC = b'LZWP'
+VERSION = 1
+
+MIN_BITS = 9
+MAX_BITS = 12
+LIMIT_BITS = 16
+
+# flags
+FLAG_CLEAR = 0x01  # code 256 is CLEAR, new entries start at 257
+FLAG_HUFFMAN = 0x02  # codes are Huffman-coded in blocks, see huffman.py
+
+CLEAR_CODE = 256
+
+# written by streaming compressors that cannot know the length up front
+UNKNOWN_LENGTH = 2 ** 64 - 1
+
+
+class CodeWriter:
+    """Pack LZW codes MSB-first at the width the decoder will expect."""
+
+    def __init__(self, max_bits=MAX_BITS, clear=False):
+        self.max_bits = max_bits
+        self.clear_code = CLEAR_CODE if clear else None
+        self.first_code = 257 if clear else 256
+        self.output = bytearray()
+        self.bytes_taken = 0
+        self.bit_buffer = 0
+        self.bit_count = 0
+        self.reset_width()
+
+    def reset_width(self):
+        """Restart the width schedule (after a CLEAR code)."""
+        self.width = MIN_BITS
+        self.next_width_at = 1 << MIN_BITS
+        self.available = self.first_code - 1
+
+    def write(self, codes):
+        """Append a sequence of codes."""
+        output = self.output
+        bit_buffer = self.bit_buffer
+        bit_count = self.bit_count
+        width = self.width
+        next_width_at = self.next_width_at
+        available = self.available
+        max_bits = self.max_bits
+        clear_code = self.clear_code
+
+        for code in codes:
+            bit_buffer = (bit_buffer << width) | code
+            bit_count += width
+            while bit_count >= 8:
+                bit_count -= 8
+                output.append((bit_buffer >> bit_count) & 0xFF)
+            bit_buffer &= (1 << bit_count) - 1
+
+            if code == clear_code:
+                width = MIN_BITS
+                next_width_at = 1 << MIN_BITS
+                available = self.first_code - 1
+                continue
+            available += 1
+            if available >= next_width_at and width < max_bits:
+                width += 1
+                next_width_at <<= 1
+
+        self.bit_buffer = bit_buffer
+        self.bit_count = bit_count
+        self.width = width
+        self.next_width_at = next_width_at
+        self.available = available
+
+    def take(self):
+        """Return the complete bytes written so far and drop them."""
+        data = bytes(self.output)
+        self.bytes_taken += len(data)
+        self.output.clear()
+        return data
+
+    def tell_bits(self):
+        """Number of bits written so far, including taken bytes."""
+        return (self.bytes_taken + len(self.output)) * 8 + self.bit_count
+
+    def flush(self):
+        """Pad the last partial byte with zero bits and return the rest."""
+        if self.bit_count:
+            self.output.append((self.bit_buffer << (8 - self.bit_count)) & 0xFF)
+            self.bit_buffer = 0
+            self.bit_count = 0
+        return self.take()
+
+
+class CodeReader:
+    """Unpack codes written by CodeWriter, possibly split across chunks."""
+
+    def __init__(self, max_bits=MAX_BITS, clear=False):
+        self.max_bits = max_bits
+        self.clear_code = CLEAR_CODE if clear else None
+        self.first_code = 257 if clear else 256
+        self.bit_buffer = 0
+        self.bit_count = 0
+        self.reset_width()
+
+    def reset_width(self):
+        """Restart the width schedule (after a CLEAR code)."""
+        self.width = MIN_BITS
+        self.next_width_at = 1 << MIN_BITS
+        self.available = self.first_code - 1
+
+    def read(self, data):
+        """Return the list of codes completed by data."""
+        codes = []
+        append = codes.append
+        bit_buffer = self.bit_buffer
+        bit_count = self.bit_count
+        width = self.width
+        next_width_at = self.next_width_at
+        available = self.available
+        max_bits = self.max_bits
+        clear_code = self.clear_code
+
+        for byte in data:
+            bit_buffer = (bit_buffer << 8) | byte
+            bit_count += 8
+            if bit_count >= width:
+                bit_count -= width
+                code = bit_buffer >> bit_count
+                append(code)
+                bit_buffer &= (1 << bit_count) - 1
+
+                if code == clear_code:
+                    width = MIN_BITS
+                    next_width_at = 1 << MIN_BITS
+                    available = self.first_code - 1
+                    continue
+                available += 1
+                if available >= next_width_at and width < max_bits:
+                    width += 1
+                    next_width_at <<= 1
+
+        self.bit_buffer = bit_buffer
+        self.bit_count = bit_count
+        self.width = width
+        self.next_width_at = next_width_at
+        self.available = available
+        return codes
+
+
+def pack_codes_fixed(codes):
+    """Pack codes as 16-bit big-endian integers (the original layout)."""
+    if np is not None:
+        return np.asarray(codes, dtype='>u2').tobytes()
+    packed = array('H', codes)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_codes_fixed(data):
+    if np is not None:
+        return np.frombuffer(data, dtype='>u2').tolist()
+    packed = array('H')
+    packed.frombytes(data)
+    if sys.byteorder == 'little':
+        packed.byteswap()
+    return packed.tolist()
+
+
+def _code_widths(counts, max_bits, first_code):
+    """Width of the code read after counts codes since the last CLEAR."""
+    available = np.minimum(first_code - 1 + counts, (1 << max_bits) - 1)
+    return np.maximum(MIN_BITS, np.log2(available).astype(np.int64) + 1)
+
+
+def _pack_codes_numpy(codes, max_bits, clear):
+    codes = np.fromiter(codes, dtype=np.int64, count=len(codes))
+    positions = np.arange(len(codes), dtype=np.int64)
+    first_code = 257 if clear else 256
+    if clear:
+        # position of the last CLEAR strictly before each code
+        clears = np.where(codes == CLEAR_CODE, positions, -1)
+        last_clear = np.empty_like(positions)
+        last_clear[0] = -1
+        np.maximum.accumulate(clears[:-1], out=last_clear[1:])
+        counts = positions - last_clear - 1
+    else:
+        counts = positions
+    widths = _code_widths(counts, max_bits, first_code)
+    return pack_bits_numpy(codes, widths)
+
+
+def pack_bits_numpy(values, widths):
+    """Pack values of at most 16 bits MSB-first at the given bit widths."""
+    ends = np.cumsum(widths)
+    starts = ends - widths
+
+    # a value of at most 16 bits spans at most 3 bytes: place it in a 24-bit
+    # window at its byte and add the window bytes up (the bits are disjoint)
+    size = (int(ends[-1]) + 7) >> 3
+    windows = values << (24 - (starts & 7) - widths)
+    byte_index = starts >> 3
+    packed = np.bincount(byte_index, windows >> 16, size + 2)
+    packed += np.bincount(byte_index + 1, (windows >> 8) & 0xFF, size + 2)
+    packed += np.bincount(byte_index + 2, windows & 0xFF, size + 2)
+    return packed[:size].astype(np.uint8).tobytes()
+
+
+def _unpack_codes_numpy(data, max_bits):
+    bit_length = len(data) * 8
+    widths = _code_widths(np.arange(bit_length // MIN_BITS, dtype=np.int64),
+                          max_bits, 256)
+    ends = np.cumsum(widths)
+    count = np.searchsorted(ends, bit_length, side='right')
+    widths = widths[:count]
+    starts = ends[:count] - widths
+
+    padded = np.frombuffer(bytes(data) + b'\0\0', dtype=np.uint8)
+    padded = padded.astype(np.int64)
+    byte_index = starts >> 3
+    windows = ((padded[byte_index] << 16) | (padded[byte_index + 1] << 8) |
+               padded[byte_index + 2])
+    codes = (windows >> (24 - (starts & 7) - widths)) & ((1 << widths) - 1)
+    return codes.tolist()
+
+
+def pack_codes(codes, max_bits=MAX_BITS, clear=False):
+    """Pack a whole code stream; vectorized when NumPy is available."""
+    if np is not None and len(codes):
+        return _pack_codes_numpy(codes, max_bits, clear)
+    writer = CodeWriter(max_bits, clear)
+    writer.write(codes)
+    return writer.flush()
+
+
+def unpack_codes(data, max_bits=MAX_BITS, clear=False):
+    """Unpack a whole code stream; vectorized when NumPy is available.
+
+    With CLEAR codes the widths depend on the data, so those streams are
+    always read code by code.
+    """
+    if np is not None and not clear and len(data):
+        return _unpack_codes_numpy(data, max_bits)
+    return CodeReader(max_bits, clear).read(data)
+
+
+def header_bytes(original_length, max_bits=MAX_BITS, flags=0):
+    return HEADER.pack(MAGIC, VERSION, max_bits, flags, original_length)
+
+
+def write_header(file, original_length, max_bits=MAX_BITS, flags=0):
+    file.write(header_bytes(original_length, max_bits, flags))
+
+
+def parse_header(header):
+    """Return (max_bits, flags, original_length) from a .lzw header."""
+    if len(header) != HEADER.size:
+        raise ValueError('Truncated LZW header')
+    magic, version, max_bits, flags, original_length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f'Not a bit-packed LZW file (magic {magic!r})')
+    if version != VERSION:
+        raise ValueError(f'Unsupported LZW format version {version}')
+    if not MIN_BITS <= max_bits <= LIMIT_BITS:
+        raise ValueError(f'Unsupported LZW code width {max_bits}')
+    return max_bits, flags, original_length
+
+
+def read_header(file):
+    return parse_header(file.read(HEADER.size))
+
+
+def write_lzw(file, codes, original_length, max_bits=MAX_BITS, huffman=False):
+    """Write a header followed by the bit-packed code stream.
+
+    With huffman the codes are entropy-coded instead, unless that comes out
+    larger (tiny inputs, where the tables dominate).
+    """
+    flags = 0
+    payload = pack_codes(codes, max_bits)
+    if huffman:
+        from huffman import MAX_CODE_LENGTH, encode_codes
+
+        if max_bits > MAX_CODE_LENGTH:
+            raise ValueError(
+                f'Huffman coding supports max_bits up to {MAX_CODE_LENGTH}')
+        huffman_payload = encode_codes(codes)
+        if len(huffman_payload) < len(payload):
+            flags, payload = FLAG_HUFFMAN, huffman_payload
+    file.write(header_bytes(original_length, max_bits, flags) + payload)
+
+
+def read_lzw(file):
+    """Return (codes, original_length) from a file written by write_lzw."""
+    max_bits, flags, original_length = read_header(file)
+    if flags & FLAG_HUFFMAN:
+        from huffman import decode_codes
+
+        return decode_codes(file.read()), original_length
+    codes = unpack_codes(file.read(), max_bits, bool(flags & FLAG_CLEAR))
+    return codes, original_length
@@ -0,0 +1,398 @@
+import mmap
+import os
+from contextlib import contextmanager
+
+from Timer import profiler
+from huffman import BLOCK_CODES, MAX_CODE_LENGTH, HuffmanReader, \
+    HuffmanWriter, encode_codes
+from lzw_format import (CodeWriter, CodeReader, HEADER, MIN_BITS, MAX_BITS,
+                        LIMIT_BITS, CLEAR_CODE, FLAG_CLEAR, FLAG_HUFFMAN,
+                        UNKNOWN_LENGTH, header_bytes, parse_header)
+
+CHUNK_SIZE = 1 << 20
+
+# what to do once every code of max_bits is in use
+POLICY_FREEZE = 'freeze'      # keep the full table (legacy lzw_compress)
+POLICY_RESET = 'reset'        # emit CLEAR and start over
+POLICY_ADAPTIVE = 'adaptive'  # emit CLEAR when the ratio starts to drop
+POLICIES = (POLICY_FREEZE, POLICY_RESET, POLICY_ADAPTIVE)
+
+# input bytes between ratio checks of the adaptive policy
+CHECK_GAP = 1 << 14
+
+
+class LZWCompressor:
+    """Incremental compressor producing the bit-packed .lzw format.
+
+    Works like zlib.compressobj: every feed() returns the compressed bytes
+    that are complete so far and flush() returns the remainder. The header
+    records an unknown original length; compress_file patches it in.
+
+    policy decides what happens once the table is full, see POLICIES.
+    huffman entropy-codes the codes in blocks instead of bit-packing them,
+    if that makes the first block (or a shorter stream) smaller; output
+    is held back until that is decided.
+    """
+
+    def __init__(self, max_bits=MAX_BITS, policy=POLICY_FREEZE, huffman=False):
+        if not MIN_BITS <= max_bits <= LIMIT_BITS:
+            raise ValueError(f'max_bits must be in [{MIN_BITS}, {LIMIT_BITS}]')
+        if policy not in POLICIES:
+            raise ValueError(f'Unknown table-full policy {policy!r}')
+        if huffman and policy == POLICY_ADAPTIVE:
+            # the ratio checks need the exact output size, which Huffman
+            # blocks only know once they are full
+            raise ValueError('The adaptive policy cannot be Huffman-coded')
+        if huffman and max_bits > MAX_CODE_LENGTH:
+            # every code needs a codeword of at most MAX_CODE_LENGTH bits
+            raise ValueError(
+                f'Huffman coding supports max_bits up to {MAX_CODE_LENGTH}')
+
+        clear = policy != POLICY_FREEZE
+        self.max_bits = max_bits
+        self.max_code = 2 ** max_bits
+        self.policy = policy
+        self.flags = (FLAG_CLEAR if clear else 0) | \
+            (FLAG_HUFFMAN if huffman else 0)
+        self.first_code = 257 if clear else 256
+        self.writer = CodeWriter(max_bits, clear)
+        # codes held until _choose_writer decides on Huffman coding
+        self.undecided = [] if huffman else None
+        self.dictionary = {}
+        self.current_code = self.first_code
+        self.code = None
+        self.header = header_bytes(UNKNOWN_LENGTH, max_bits, self.flags)
+
+        # adaptive policy bookkeeping, counted since the last CLEAR
+        self.bytes_in = 0
+        self.bits_at_clear = 0
+        self.best_ratio = 0.0
+
+    def _write(self, codes):
+        if self.undecided is None:
+            self.writer.write(codes)
+            return
+        self.undecided.extend(codes)
+        if len(self.undecided) >= BLOCK_CODES:
+            self._choose_writer()
+
+    def _choose_writer(self):
+        """Keep Huffman coding only if it shrinks the first block."""
+        codes = self.undecided
+        self.undecided = None
+        block = codes[:BLOCK_CODES]
+        huffman_block = encode_codes(block)
+        self.writer.write(block)
+        if len(huffman_block) < (self.writer.tell_bits() + 7) // 8:
+            self.writer = HuffmanWriter()
+            self.writer.output += huffman_block
+        else:
+            self.flags &= ~FLAG_HUFFMAN
+        self.header = header_bytes(UNKNOWN_LENGTH, self.max_bits, self.flags)
+        self.writer.write(codes[BLOCK_CODES:])
+
+    def _take(self):
+        if self.undecided is not None:
+            return b''
+        data = self.writer.take()
+        if self.header is not None:
+            data = self.header + data
+            self.header = None
+        return data
+
+    def feed(self, chunk):
+        """Compress chunk and return whatever output is ready."""
+        with profiler.span('lzw.compress'):
+            if self.policy == POLICY_ADAPTIVE:
+                view = memoryview(chunk)
+                for start in range(0, len(view), CHECK_GAP):
+                    block = view[start:start + CHECK_GAP]
+                    self._compress(block)
+                    self._check_ratio(len(block))
+            elif chunk:
+                self._compress(chunk)
+            return self._take()
+
+    def _clear(self):
+        self.dictionary.clear()
+        self.current_code = self.first_code
+
+    def _check_ratio(self, length):
+        self.bytes_in += length
+        if self.current_code < self.max_code:
+            return
+
+        bits = self.writer.tell_bits() - self.bits_at_clear
+        ratio = self.bytes_in * 8 / bits if bits else 0.0
+        if ratio > self.best_ratio:
+            self.best_ratio = ratio
+            return
+
+        codes = [CLEAR_CODE]
+        if self.code is not None:
+            codes.insert(0, self.code)
+            self.code = None
+        self._write(codes)
+        self._clear()
+        self.bytes_in = 0
+        self.bits_at_clear = self.writer.tell_bits()
+        self.best_ratio = 0.0
+
+    def _compress(self, chunk):
+        with profiler.span('dictionary'):
+            codes = self._lookup(chunk)
+        with profiler.span('pack'):
+            self._write(codes)
+
+    def _lookup(self, chunk):
+        dictionary = self.dictionary
+        current_code = self.current_code
+        max_code = self.max_code
+        first_code = self.first_code
+        reset_on_full = self.policy == POLICY_RESET
+        codes = []
+        append = codes.append
+
+        iterator = iter(chunk)
+        code = self.code
+        if code is None:
+            code = next(iterator)
+
+        for byte in iterator:
+            key = (code << 8) | byte
+            next_code = dictionary.get(key)
+            if next_code is not None:
+                code = next_code
+            else:
+                append(code)
+                if current_code < max_code:
+                    dictionary[key] = current_code
+                    current_code += 1
+                elif reset_on_full:
+                    append(CLEAR_CODE)
+                    dictionary.clear()
+                    current_code = first_code
+                code = byte
+
+        self.code = code
+        self.current_code = current_code
+        return codes
+
+    def flush(self):
+        """Emit the pending code and return the final bytes."""
+        if self.code is not None:
+            self._write((self.code,))
+            self.code = None
+        if self.undecided is not None:
+            self._choose_writer()
+        data = self._take()
+        return data + self.writer.flush()
+
+
+class LZWDecompressor:
+    """Incremental decompressor for the bit-packed .lzw format."""
+
+    def __init__(self):
+        self.pending_header = b''
+        self.reader = None
+        self.flags = 0
+        self.original_length = None
+        self.decompressed_length = 0
+        self.table = [bytes([i]) for i in range(256)]
+        self.first_code = 256
+        self.clear_code = None
+        self.max_code = None
+        self.previous = None
+
+    def feed(self, chunk):
+        """Decompress chunk and return whatever output is ready."""
+        with profiler.span('lzw.decompress'):
+            return self._decompress(chunk)
+
+    def _decompress(self, chunk):
+        if self.reader is None:
+            self.pending_header += chunk
+            if len(self.pending_header) < HEADER.size:
+                return b''
+            max_bits, flags, self.original_length = parse_header(
+                self.pending_header[:HEADER.size])
+            chunk = self.pending_header[HEADER.size:]
+            self.pending_header = b''
+            clear = bool(flags & FLAG_CLEAR)
+            self.flags = flags
+            self.reader = HuffmanReader() if flags & FLAG_HUFFMAN else \
+                CodeReader(max_bits, clear)
+            self.max_code = 2 ** max_bits
+            if clear:
+                self.clear_code = CLEAR_CODE
+                self.first_code = 257
+                self.table.append(b'')  # placeholder for CLEAR
+
+        with profiler.span('unpack'):
+            codes = self.reader.read(chunk)
+        with profiler.span('dictionary'):
+            data = self._decode(codes)
+        self.decompressed_length += len(data)
+        return data
+
+    def _decode(self, codes):
+        table = self.table
+        max_code = self.max_code
+        first_code = self.first_code
+        clear_code = self.clear_code
+        previous = self.previous
+        output = []
+        append = output.append
+
+        for code in codes:
+            if code == clear_code:
+                del table[first_code:]
+                previous = None
+                continue
+            if previous is None:
+                entry = table[code]
+            else:
+                next_code = len(table)
+                if code < next_code:
+                    entry = table[code]
+                elif code == next_code:
+                    entry = previous + previous[:1]
+                else:
+                    raise ValueError(f'Invalid LZW code {code}')
+                if next_code < max_code:
+                    table.append(previous + entry[:1])
+            append(entry)
+            previous = entry
+
+        self.previous = previous
+        return b''.join(output)
+
+    def flush(self):
+        """Check the stream ended cleanly; return any remaining bytes."""
+        if self.reader is None:
+            raise ValueError('Truncated LZW header')
+        if self.flags & FLAG_HUFFMAN:
+            self.reader.finish()
+        if (self.original_length != UNKNOWN_LENGTH and
+                self.decompressed_length != self.original_length):
+            raise ValueError(f'Expected {self.original_length} bytes, '
+                             f'got {self.decompressed_length}')
+        return b''
+
+
+@contextmanager
+def mapped_file(filename):
+    """Yield a read-only memoryview over a memory-mapped file.
+
+    Pages are loaded on demand and can be dropped by the OS again, so
+    resident memory follows the working set instead of the file size.
+    """
+    with open(filename, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            yield memoryview(b'')
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view
+            finally:
+                view.release()
+
+
+def _compress_chunks(chunks, output_file, max_bits, policy, huffman=False):
+    compressor = LZWCompressor(max_bits, policy, huffman)
+    start = output_file.tell() if output_file.seekable() else None
+    original_length = 0
+
+    for chunk in chunks:
+        original_length += len(chunk)
+        data = compressor.feed(chunk)
+        with profiler.span('lzw.write'):
+            output_file.write(data)
+    data = compressor.flush()
+    with profiler.span('lzw.write'):
+        output_file.write(data)
+
+    if start is not None:
+        end = output_file.tell()
+        output_file.seek(start)
+        output_file.write(
+            header_bytes(original_length, max_bits, compressor.flags))
+        output_file.seek(end)
+
+    return original_length
+
+
+def compress_stream(input_file, output_file, max_bits=MAX_BITS,
+                    policy=POLICY_FREEZE, chunk_size=CHUNK_SIZE,
+                    huffman=False):
+    """Compress between binary file objects; return the original length."""
+    def chunks():
+        while True:
+            with profiler.span('lzw.read'):
+                chunk = input_file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+    return _compress_chunks(chunks(), output_file, max_bits, policy, huffman)
+
+
+def _buffer_chunks(view, chunk_size):
+    for start in range(0, len(view), chunk_size):
+        with view[start:start + chunk_size] as chunk:
+            yield chunk
+
+
+def compress_buffer(data, output_file, max_bits=MAX_BITS,
+                    policy=POLICY_FREEZE, chunk_size=CHUNK_SIZE,
+                    huffman=False):
+    """Compress any bytes-like object (e.g. an mmap) without copying it.
+
+    Multi-byte and multi-dimensional buffers are compressed as their raw
+    bytes. Every view is released before returning, even on errors, so
+    the caller can close an mmap behind data.
+    """
+    with memoryview(data) as view, view.cast('B') as flat:
+        chunks = _buffer_chunks(flat, chunk_size)
+        try:
+            return _compress_chunks(chunks, output_file, max_bits, policy,
+                                    huffman)
+        finally:
+            chunks.close()
+
+
+def decompress_stream(input_file, output_file, chunk_size=CHUNK_SIZE):
+    """Decompress between binary file objects; return the output length."""
+    decompressor = LZWDecompressor()
+
+    while True:
+        with profiler.span('lzw.read'):
+            chunk = input_file.read(chunk_size)
+        if not chunk:
+            break
+        data = decompressor.feed(chunk)
+        with profiler.span('lzw.write'):
+            output_file.write(data)
+    output_file.write(decompressor.flush())
+
+    return decompressor.decompressed_length
+
+
+def compress_file(input_filename, output_filename, max_bits=MAX_BITS,
+                  policy=POLICY_FREEZE, chunk_size=CHUNK_SIZE, huffman=False):
+    """Compress a file into the bit-packed .lzw format in bounded memory.
+
+    The input is memory-mapped and compressed straight from the mapping.
+    """
+    with mapped_file(input_filename) as data, \
+            open(output_filename, 'wb') as compressed_file:
+        return compress_buffer(data, compressed_file, max_bits, policy,
+                               chunk_size, huffman)
+
+
+def decompress_file(input_filename, output_filename, chunk_size=CHUNK_SIZE):
+    """Decompress a .lzw file in bounded memory."""
+    with open(input_filename, 'rb') as compressed_file, \
+            open(output_filename, 'wb') as file:
+        return decompress_stream(compressed_file, file, chunk_size)
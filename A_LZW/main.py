@@ -1,5 +1,10 @@
 import os
 from Timer import Timer
+from cache import CompressionCache
+from lzw_format import write_lzw, read_lzw
+from lzw_stream import mapped_file
+from metrics import calculate_compression_ratio, calculate_compression_speed, \
+    calculate_decompression_speed
 
 
 def lzw_compress(data):
@@ -29,6 +34,36 @@ def lzw_compress(data):
     return result
 
 
+def lzw_compress_fast(data, max_bits=12):
+    """LZW compress keyed on (prefix code, byte) pairs; same codes as lzw_compress."""
+    dictionary = {}
+    result = []
+    append = result.append
+    current_code = 256
+    max_code = 2 ** max_bits
+
+    if not data:
+        return result
+
+    iterator = iter(data)
+    code = next(iterator)
+    for byte in iterator:
+        key = (code << 8) | byte
+        next_code = dictionary.get(key)
+        if next_code is not None:
+            code = next_code
+        else:
+            append(code)
+            if current_code < max_code:
+                dictionary[key] = current_code
+                current_code += 1
+            code = byte
+
+    append(code)
+
+    return result
+
+
 def lzw_decompress(compressed_data):
     dictionary = {i: bytes([i]) for i in range(256)}
     code_width = 9  # Initial code width
@@ -54,64 +89,185 @@ def lzw_decompress(compressed_data):
     return bytes(result)
 
 
-def calculate_compression_ratio(original_size, compressed_size):
-    return compressed_size / original_size
+def lzw_decompress_fast(compressed_data, max_bits=12):
+    """Same result as lzw_decompress, returned as a bytearray.
+
+    Dictionary entries are (offset, length) references into the output
+    instead of separate bytes objects.
+    """
+    output = bytearray()
+    if not compressed_data:
+        return output
+
+    append = output.append
+    extend = output.extend
+    starts = []
+    lengths = []
+    entry_count = 0
+    max_entries = 2 ** max_bits - 256
+
+    iterator = iter(compressed_data)
+    append(next(iterator))
+    previous_start = 0
+    previous_length = 1
+    position = 1
+
+    for code in iterator:
+        if code < 256:
+            append(code)
+            length = 1
+        else:
+            index = code - 256
+            if index < entry_count:
+                start = starts[index]
+                length = lengths[index]
+                extend(output[start:start + length])
+            elif index == entry_count:
+                extend(output[previous_start:previous_start + previous_length])
+                append(output[previous_start])
+                length = previous_length + 1
+            else:
+                raise ValueError(f'Invalid LZW code {code}')
+
+        if entry_count < max_entries:
+            starts.append(previous_start)
+            lengths.append(previous_length + 1)
+            entry_count += 1
+        previous_start = position
+        previous_length = length
+        position += length
+
+    return output
+
+
+def lzw_decompress_into(compressed_data, buffer, max_bits=12):
+    """Decompress into a caller-supplied writable buffer.
+
+    Returns the number of bytes written; raises ValueError if buffer is
+    too small. Copies go memoryview to memoryview, so nothing is
+    allocated per code.
+    """
+    if not compressed_data:
+        return 0
 
+    view = memoryview(buffer).cast('B')
+    capacity = len(view)
+    starts = []
+    lengths = []
+    entry_count = 0
+    max_entries = 2 ** max_bits - 256
 
-def calculate_compression_speed(original_size, compression_time):
-    return original_size / compression_time
+    iterator = iter(compressed_data)
+    if capacity < 1:
+        raise ValueError('Output buffer too small')
+    view[0] = next(iterator)
+    previous_start = 0
+    previous_length = 1
+    position = 1
+
+    for code in iterator:
+        index = code - 256
+        if index < 0:
+            length = 1
+        elif index < entry_count:
+            length = lengths[index]
+        elif index == entry_count:
+            length = previous_length + 1
+        else:
+            raise ValueError(f'Invalid LZW code {code}')
+        end = position + length
+        if end > capacity:
+            raise ValueError('Output buffer too small')
+
+        if index < 0:
+            view[position] = code
+        elif index < entry_count:
+            start = starts[index]
+            view[position:end] = view[start:start + length]
+        else:
+            view[position:end - 1] = \
+                view[previous_start:previous_start + previous_length]
+            view[end - 1] = view[previous_start]
 
+        if entry_count < max_entries:
+            starts.append(previous_start)
+            lengths.append(previous_length + 1)
+            entry_count += 1
+        previous_start = position
+        previous_length = length
+        position = end
 
-def calculate_decompression_speed(decompressed_size, decompression_time):
-    return decompressed_size / decompression_time
+    return position
 
-def test_lzw_compression_1(extensions):
+
+def test_lzw_compression_1(extensions, cache=None):
     timer = Timer()
     for extension in extensions:
         input_filename = f'res/file{extension}'
-        with open(input_filename, 'rb') as file:
-            data = file.read()
-
-        print('**************************************************')
-        timer.start()
-        compressed = lzw_compress(data)
-        compressed_filename = f'compressed/file_compressed{extension}.lzw'
-        with open(compressed_filename, 'wb') as compressed_file:
-            for code in compressed:
-                compressed_file.write(code.to_bytes(2, byteorder='big'))
-        print(f'Compressed \t{extension} \t in {timer.stop():.5f} seconds')
-
-        # Calculate compression ratio
-        original_size = os.path.getsize(input_filename)
-        compressed_size = os.path.getsize(compressed_filename)
-        compression_ratio = calculate_compression_ratio(
-            original_size, compressed_size)
-
-        compression_speed = calculate_compression_speed(
-            original_size, timer.elapsed_time)
-
-        timer.start()
-        decompressed = lzw_decompress(compressed)
-        decompressed_filename = f'decompressed/file_decompressed{extension}'
-        with open(decompressed_filename, 'wb') as decompressed_file:
-            decompressed_file.write(decompressed)
-        print(f'Decompressed \t{extension} \t in {timer.stop():.5f} seconds')
-
-        decompressed_size = os.path.getsize(decompressed_filename)
-        decompression_speed = calculate_decompression_speed(
-            decompressed_size, timer.elapsed_time)
-        print('--------------------------------------------------')
-        print(f'File: {input_filename}')
-        print(f'Original Size: \t\t{original_size:,} \t bytes')
-        print(f'Compressed Size: \t{compressed_size:,} \t bytes')
-
-        print(f'Compression Ratio: \t{compression_ratio:.4f}')
-        print(f'Compression Speed: \t{compression_speed:,.4f} \t bytes/second')
-        print(
-            f'Decompression Speed: \t{decompression_speed:,.4f} \t bytes/second')
-        print('--------------------------------------------------\n')
-
-
-extensions = ['.doc', '.docx', '.pdf', '.png',
-              '.jpg', '.gif', '.bmp', '.mp3', '.wav']
-test_lzw_compression_1(extensions)
+        if not os.path.exists(input_filename):
+            print(f'Skipping \t{extension} \t {input_filename} not found')
+            continue
+        with mapped_file(input_filename) as data:
+            print('**************************************************')
+            timer.start()
+            compressed_filename = f'compressed/file_compressed{extension}.lzw'
+            key = None
+            if cache is not None:
+                key = cache.key(input_filename, 'lzw', max_bits=12)
+            cached = key is not None and cache.fetch(key, compressed_filename)
+            if not cached:
+                compressed = lzw_compress(data)
+                with open(compressed_filename, 'wb') as compressed_file:
+                    write_lzw(compressed_file, compressed, len(data))
+                if key is not None:
+                    cache.store(key, compressed_filename)
+                print(f'Compressed \t{extension} \t in {timer.stop():.5f} seconds')
+            else:
+                print(f'Cached \t\t{extension} \t in {timer.stop():.5f} seconds')
+
+            # Calculate compression ratio
+            original_size = os.path.getsize(input_filename)
+            compressed_size = os.path.getsize(compressed_filename)
+            compression_ratio = calculate_compression_ratio(
+                original_size, compressed_size)
+
+            compression_speed = calculate_compression_speed(
+                original_size, timer.elapsed_time)
+
+            timer.start()
+            with open(compressed_filename, 'rb') as compressed_file:
+                codes, original_length = read_lzw(compressed_file)
+            decompressed = lzw_decompress(codes)
+            if decompressed != data:
+                raise ValueError(f'{extension}: round trip mismatch')
+            decompressed_filename = f'decompressed/file_decompressed{extension}'
+            with open(decompressed_filename, 'wb') as decompressed_file:
+                decompressed_file.write(decompressed)
+            print(f'Decompressed \t{extension} \t in {timer.stop():.5f} seconds')
+
+            decompressed_size = os.path.getsize(decompressed_filename)
+            decompression_speed = calculate_decompression_speed(
+                decompressed_size, timer.elapsed_time)
+            print('--------------------------------------------------')
+            print(f'File: {input_filename}')
+            print(f'Original Size: \t\t{original_size:,} \t bytes')
+            print(f'Compressed Size: \t{compressed_size:,} \t bytes')
+
+            print(f'Compression Ratio: \t{compression_ratio:.4f}')
+            if cached:
+                # the timed work was a copy out of the cache
+                print('Compression Speed: \tcached')
+            else:
+                print(f'Compression Speed: \t{compression_speed:,.4f} \t bytes/second')
+            print(
+                f'Decompression Speed: \t{decompression_speed:,.4f} \t bytes/second')
+            print('--------------------------------------------------\n')
+
+
+if __name__ == "__main__":
+    # benchmarks live in `python -m lzw bench`; this regenerates the
+    # compressed/ and decompressed/ artifacts for whatever is in res/
+    extensions = sorted(os.path.splitext(file_name)[1]
+                        for file_name in os.listdir('res')
+                        if file_name.startswith('file'))
+    test_lzw_compression_1(extensions, CompressionCache())
@@ -0,0 +1,21 @@
+import math
+
+
+def calculate_compression_ratio(original_size, compressed_size):
+    return compressed_size / original_size
+
+
+def calculate_compression_speed(original_size, compression_time):
+    return original_size / compression_time
+
+
+def calculate_decompression_speed(decompressed_size, decompression_time):
+    return decompressed_size / decompression_time
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of values."""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
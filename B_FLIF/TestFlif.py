@@ -0,0 +1,87 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+lib_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib')
+sys.path.append(lib_path)
+from pyflif import FlifDecoder, decode_from_bytes, encode_to_bytes, \
+    read_flif, read_flif_thumbnail, write_flif_sequence
+from pyflif.flif_wrapper_common import load_libflif
+
+
+def libflif_available():
+    try:
+        load_libflif()
+    except OSError:
+        return False
+    return True
+
+
+# the bindings are plain ctypes, so only a real libflif catches signature
+# mistakes; without one these tests are skipped
+requires_libflif = pytest.mark.skipif(not libflif_available(),
+                                      reason='libflif not found')
+
+SHAPES = {
+    'gray': ((48, 64), np.uint8),
+    'gray16': ((48, 64), np.uint16),
+    'rgb': ((48, 64, 3), np.uint8),
+    'rgba': ((48, 64, 4), np.uint8),
+}
+
+
+def make_image(name, seed=0):
+    shape, dtype = SHAPES[name]
+    rng = np.random.default_rng(seed)
+    # a gradient plus noise, so the encoder has something to model
+    image = np.add.outer(np.arange(shape[0]), np.arange(shape[1])) * 3
+    image = image.reshape(shape[:2] + (1,) * (len(shape) - 2))
+    image = image + rng.integers(0, 16, shape)
+    image = (image % (np.iinfo(dtype).max + 1)).astype(dtype)
+    if shape[2:] == (4,):
+        # libflif may drop the colour of fully transparent pixels
+        image[..., 3] = 255
+    return image
+
+
+@requires_libflif
+@pytest.mark.parametrize('name', SHAPES)
+def test_memory_round_trip(name):
+    image = make_image(name)
+    data = encode_to_bytes(image)
+    assert data[:4] == b'FLIF'
+    decoded = decode_from_bytes(data)
+    assert decoded.shape == image.shape
+    assert (decoded == image).all()
+
+
+@requires_libflif
+def test_sequence_round_trip(tmp_path):
+    frames = [make_image('rgba', seed) for seed in range(2)]
+    path = str(tmp_path / 'sequence.flif')
+    stats = write_flif_sequence(path, (frame for frame in frames))
+    assert stats['frames'] == 2
+    assert stats['bytes'] == sum(frame.nbytes for frame in frames)
+
+    with FlifDecoder(path) as decoder:
+        assert len(decoder) == 2
+        for index, frame in enumerate(frames):
+            assert (decoder.get_image(index) == frame).all()
+    assert (read_flif(path, 1) == frames[1]).all()
+
+
+@requires_libflif
+def test_thumbnail(tmp_path):
+    image = make_image('rgb')
+    path = str(tmp_path / 'image.flif')
+    with open(path, 'wb') as file:
+        file.write(encode_to_bytes(image, interlaced=True))
+    thumbnail = read_flif_thumbnail(path, 16)
+    assert max(thumbnail.shape[:2]) <= 16
+
+
+def test_empty_sequence(tmp_path):
+    with pytest.raises(ValueError):
+        write_flif_sequence(str(tmp_path / 'empty.flif'), iter(()))
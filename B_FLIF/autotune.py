@@ -0,0 +1,208 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from multiprocessing import Pool
+
+lib_path = os.path.join(os.path.dirname(__file__), 'lib')
+sys.path.append(lib_path)
+from pyflif.flif_convenience import PRESETS_FILE, encode_to_bytes, \
+    decode_from_bytes, register_preset, load_presets
+
+lzw_path = os.path.join(os.path.dirname(__file__), '..', 'A_LZW')
+sys.path.append(lzw_path)
+from Timer import Timer
+
+from image_io import load_image_array
+
+# FlifEncoder options swept by default; maxloss stays lossless
+PARAMETER_GRID = {
+    'learn_repeat': [0, 1, 2, 4],
+    'split_threshold_factor': [4, 12, 24],
+    'interlaced': [False, True],
+    'maxloss': [0],
+}
+
+METRICS = ('encode_ms_per_mp', 'decode_ms_per_mp', 'bytes_per_pixel')
+
+# sample images of a worker process, loaded once by _load_samples
+_samples = None
+
+
+def parameter_sets(grid=None):
+    """Every combination of the grid's values as encoder option dicts."""
+    grid = grid or PARAMETER_GRID
+    names = sorted(grid)
+    return [dict(zip(names, values))
+            for values in itertools.product(*(grid[name] for name in names))]
+
+
+def _load_samples(sample_files):
+    global _samples
+    _samples = [load_image_array(file_name) for file_name in sample_files]
+
+
+def measure(options, repeat=1):
+    """Encode and decode every sample with options; return the metrics.
+
+    Times are the best of repeat runs, summed over the samples and
+    normalized per megapixel.
+    """
+    timer = Timer()
+    encode_time = decode_time = 0.0
+    compressed_size = pixels = 0
+
+    for image in _samples:
+        encode_times = []
+        decode_times = []
+        for _ in range(repeat):
+            timer.start()
+            data = encode_to_bytes(image, **options)
+            encode_times.append(timer.stop())
+
+            timer.start()
+            decode_from_bytes(data)
+            decode_times.append(timer.stop())
+
+        encode_time += min(encode_times)
+        decode_time += min(decode_times)
+        compressed_size += len(data)
+        pixels += image.shape[0] * image.shape[1]
+
+    megapixels = pixels / 1e6
+    return {
+        'options': options,
+        'encode_ms_per_mp': encode_time * 1e3 / megapixels,
+        'decode_ms_per_mp': decode_time * 1e3 / megapixels,
+        'bytes_per_pixel': compressed_size / pixels,
+    }
+
+
+def _measure_task(arguments):
+    return measure(*arguments)
+
+
+def sweep(sample_files, grid=None, repeat=1, workers=None):
+    """Measure every parameter set, spread over worker processes.
+
+    Each worker loads the samples once; libflif encodes on one core, so
+    one process per core keeps them all busy.
+    """
+    tasks = [(options, repeat) for options in parameter_sets(grid)]
+    with Pool(workers, initializer=_load_samples,
+              initargs=(sample_files,)) as pool:
+        return pool.map(_measure_task, tasks, chunksize=1)
+
+
+def dominates(a, b):
+    return all(a[metric] <= b[metric] for metric in METRICS) and \
+        any(a[metric] < b[metric] for metric in METRICS)
+
+
+def pareto_front(results):
+    """Results no other result beats on every metric, fastest encode first."""
+    front = [result for result in results
+             if not any(dominates(other, result) for other in results)]
+    return sorted(front, key=lambda result: result['encode_ms_per_mp'])
+
+
+def choose_preset(results, encode_budget=None, size_budget=None):
+    """Pick the options of one Pareto-optimal result.
+
+    With encode_budget (ms/MP) the smallest output within it wins, with
+    size_budget (bytes/pixel) the fastest encode within it; without a
+    budget the smallest output wins. Returns None if nothing fits.
+    """
+    front = pareto_front(results)
+    if size_budget is not None:
+        fitting = [result for result in front
+                   if result['bytes_per_pixel'] <= size_budget]
+        best = min(fitting, key=lambda result: result['encode_ms_per_mp'],
+                   default=None)
+    else:
+        fitting = [result for result in front
+                   if encode_budget is None or
+                   result['encode_ms_per_mp'] <= encode_budget]
+        best = min(fitting, key=lambda result: result['bytes_per_pixel'],
+                   default=None)
+    return best['options'] if best is not None else None
+
+
+def print_report(results):
+    front = pareto_front(results)
+    print(f'{"Options":<72}{"Enc ms/MP":>11}{"Dec ms/MP":>11}'
+          f'{"B/pixel":>10}{"Pareto":>8}')
+    for result in sorted(results,
+                         key=lambda result: result['encode_ms_per_mp']):
+        options = ', '.join(f'{name}={value}'
+                            for name, value in result['options'].items())
+        print(f'{options:<72}{result["encode_ms_per_mp"]:>11.2f}'
+              f'{result["decode_ms_per_mp"]:>11.2f}'
+              f'{result["bytes_per_pixel"]:>10.4f}'
+              f'{"*" if result in front else "":>8}')
+    print(f'{len(front)} of {len(results)} parameter sets are Pareto-optimal')
+
+
+def save_report(results, output_filename):
+    with open(output_filename, 'w') as file:
+        json.dump({'results': results,
+                   'pareto_front': pareto_front(results)}, file, indent=2)
+
+
+def save_preset(name, options, presets_filename=PRESETS_FILE):
+    """Add a named preset to presets_filename and register it."""
+    presets = load_presets(presets_filename)
+    presets[name] = options
+    with open(presets_filename, 'w') as file:
+        json.dump(presets, file, indent=2)
+    register_preset(name, **options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='autotune',
+        description='Sweep FlifEncoder options over sample images.')
+    parser.add_argument('samples', nargs='+',
+                        help='sample images, or folders of them')
+    parser.add_argument('--name', default='tuned', help='preset name')
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument('--encode-budget', type=float,
+                        help='maximum encode time in ms per megapixel')
+    budget.add_argument('--size-budget', type=float,
+                        help='maximum output size in bytes per pixel')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--report', help='write the results as JSON')
+    parser.add_argument('--presets', default=PRESETS_FILE)
+    arguments = parser.parse_args(argv)
+
+    sample_files = []
+    for sample in arguments.samples:
+        if os.path.isdir(sample):
+            sample_files.extend(sorted(
+                os.path.join(sample, file_name)
+                for file_name in os.listdir(sample)
+                if os.path.isfile(os.path.join(sample, file_name))))
+        else:
+            sample_files.append(sample)
+
+    results = sweep(sample_files, repeat=arguments.repeat,
+                    workers=arguments.workers)
+    print_report(results)
+    if arguments.report:
+        save_report(results, arguments.report)
+
+    options = choose_preset(results, arguments.encode_budget,
+                            arguments.size_budget)
+    if options is None:
+        print('No parameter set fits the budget')
+        return 1
+    save_preset(arguments.name, options, arguments.presets)
+    print(f'Preset {arguments.name!r}: {options} '
+          f'(saved to {arguments.presets})')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+import ctypes as ct
+import os
+import statistics
+import subprocess
+import sys
+import tracemalloc
+
+import numpy as np
+
+lib_path = os.path.join(os.path.dirname(__file__), 'lib')
+sys.path.append(lib_path)
+from pyflif.flif_convenience import write_flif
+from pyflif.flif_image_decoding import FlifDecoder, FlifDecoderImage
+
+lzw_path = os.path.join(os.path.dirname(__file__), '..', 'A_LZW')
+sys.path.append(lzw_path)
+from Timer import Timer
+
+from utility import Compression
+
+
+def get_image_per_row_lambda(decoder_image):
+    """The original FlifDecoderImage.get_image, kept as a baseline."""
+    image_shape = decoder_image.mImgShape
+    aux_shape = (image_shape[0], np.prod(image_shape[1:]))
+    handle = decoder_image.flif_image_handle
+    row_reader = lambda row_idx, buffer, buf_size: \
+        decoder_image.row_reader(handle, row_idx, buffer, buf_size)
+
+    npy_img = np.zeros(aux_shape, dtype=decoder_image.dtype)
+    img_pointer = npy_img.ctypes.data_as(ct.c_void_p)
+    for row_idx in range(npy_img.shape[0]):
+        row_reader(row_idx, img_pointer, npy_img.strides[0])
+        img_pointer.value += npy_img.strides[0]
+
+    npy_img = npy_img.reshape(image_shape)
+    if (1 < decoder_image.nb_channels) and (4 != decoder_image.nb_channels):
+        npy_img = npy_img[:, :, :decoder_image.nb_channels].copy()
+    return npy_img
+
+
+def benchmark_get_image(flif_file_name, repeat=5):
+    """Compare the original row loop with get_image and get_image(out=...)."""
+    timer = Timer()
+    with FlifDecoder(flif_file_name) as decoder:
+        decoder_image = FlifDecoderImage(
+            decoder.Flif.get_image(decoder.flif_decoder_handle, 0))
+        out = np.empty(decoder_image.shape, dtype=decoder_image.dtype)
+        methods = [
+            ('original', lambda: get_image_per_row_lambda(decoder_image)),
+            ('get_image', decoder_image.get_image),
+            ('get_image(out)', lambda: decoder_image.get_image(out)),
+        ]
+
+        reference = None
+        print(f'{flif_file_name}: {decoder_image.shape} '
+              f'{np.dtype(decoder_image.dtype).name}')
+        for name, method in methods:
+            best_time = None
+            for _ in range(repeat):
+                timer.start()
+                image = method()
+                elapsed_time = timer.stop()
+                best_time = min(best_time or elapsed_time, elapsed_time)
+            if reference is None:
+                reference = image
+            elif not np.array_equal(image, reference):
+                raise AssertionError(f'{name} decoded different pixels')
+            print(f'{name:<16}{best_time * 1e3:>10.3f} ms'
+                  f'{image.nbytes / best_time / 1e6:>10.1f} MB/s')
+
+
+# pyflif's own import cost, without numpy; libflif is only loaded on use
+IMPORT_BUDGET_MS = 50
+
+
+def import_time(module):
+    """(own, cumulative) import time of module in a fresh interpreter, in ms.
+
+    Parses python -X importtime; own sums the module and its submodules,
+    cumulative also includes everything they import (numpy, ...).
+    """
+    process = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=lib_path, stderr=subprocess.PIPE, text=True, check=True)
+
+    own = cumulative = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if name == module or name.startswith(module + '.'):
+            own += int(self_us)
+        if name == module:
+            cumulative = int(cumulative_us)
+    return own / 1e3, cumulative / 1e3
+
+
+def benchmark_import_time(module='pyflif', repeat=5,
+                          budget_ms=IMPORT_BUDGET_MS):
+    """Report the median import time of module; 1 if over budget_ms."""
+    times = [import_time(module) for _ in range(repeat)]
+    own = statistics.median(own for own, _ in times)
+    cumulative = statistics.median(cumulative for _, cumulative in times)
+    print(f'import {module}: {own:.1f} ms own, {cumulative:.1f} ms '
+          f'with dependencies (budget {budget_ms} ms own)')
+    if own > budget_ms:
+        print(f'REGRESSION import {module} takes {own:.1f} ms')
+        return 1
+    return 0
+
+
+def _file_type(file_name):
+    return os.path.splitext(file_name)[1].lower() or '(none)'
+
+
+def compare_codecs(file_names, codec_names=None, repeat=3):
+    """Ratio, throughput and peak memory of every codec on every file.
+
+    Times are the best of repeat runs. Peak memory is what tracemalloc
+    sees, i.e. Python-side buffers, not the C libraries' own tables.
+    Codecs that cannot handle a file (e.g. JPEG on text) are skipped.
+    """
+    timer = Timer()
+    codec_names = codec_names or list(Compression.codecs)
+    rows = []
+    for file_name in file_names:
+        with open(file_name, 'rb') as file:
+            data = file.read()
+        for codec_name in codec_names:
+            codec = Compression.get_codec(codec_name)
+            compress_times = []
+            decompress_times = []
+            try:
+                for _ in range(repeat):
+                    timer.start()
+                    compressed = codec.compress(data)
+                    compress_times.append(timer.stop())
+
+                    timer.start()
+                    decompressed = codec.decompress(compressed)
+                    decompress_times.append(timer.stop())
+
+                tracemalloc.start()
+                codec.decompress(codec.compress(data))
+                _, peak_memory = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            except Exception as error:
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+                print(f'{file_name}: {codec_name} skipped ({error})')
+                continue
+
+            if codec.roundtrips and decompressed != data:
+                raise AssertionError(f'{file_name}: {codec_name} round trip')
+            rows.append({
+                'file': file_name,
+                'type': _file_type(file_name),
+                'codec': codec_name,
+                'lossless': codec.lossless,
+                'original_size': len(data),
+                'compressed_size': len(compressed),
+                'ratio': Compression.calculate_compression_ratio(
+                    len(data), len(compressed)),
+                'compress_mbps': Compression.calculate_compression_speed(
+                    len(data), min(compress_times)) / 1e6,
+                # image codecs decompress to pixels, not to the input file
+                'decompress_mbps': Compression.calculate_decompression_speed(
+                    len(decompressed), min(decompress_times)) / 1e6,
+                'peak_memory': peak_memory,
+            })
+    return rows
+
+
+def print_codec_matrix(rows):
+    codec_width = max([len('Codec')] +
+                      [len(row['codec']) for row in rows]) + 2
+    print(f'{"File":<28}{"Codec":<{codec_width}}{"Ratio":>8}{"Comp MB/s":>11}'
+          f'{"Decomp MB/s":>13}{"Peak mem":>14}')
+    for row in sorted(rows, key=lambda row: (row['type'], row['file'],
+                                             row['ratio'])):
+        print(f'{os.path.basename(row["file"]):<28}'
+              f'{row["codec"]:<{codec_width}}'
+              f'{row["ratio"]:>8.4f}{row["compress_mbps"]:>11.2f}'
+              f'{row["decompress_mbps"]:>13.2f}'
+              f'{row["peak_memory"]:>12,} B')
+
+
+def best_codecs(rows, max_ratio=1.0, lossless=True):
+    """Fastest-compressing acceptable codec per file type.
+
+    A codec is acceptable for a type if its mean ratio there is at most
+    max_ratio (and it is lossless, unless lossless is False).
+    """
+    by_type = {}
+    for row in rows:
+        if lossless and not row['lossless']:
+            continue
+        by_type.setdefault(row['type'], {}).setdefault(
+            row['codec'], []).append(row)
+
+    best = {}
+    for file_type, codecs in by_type.items():
+        candidates = []
+        for codec_name, codec_rows in codecs.items():
+            ratio = statistics.mean(row['ratio'] for row in codec_rows)
+            speed = statistics.mean(row['compress_mbps'] for row in codec_rows)
+            if ratio <= max_ratio:
+                candidates.append((speed, codec_name))
+        if candidates:
+            best[file_type] = max(candidates)[1]
+    return best
+
+
+if __name__ == "__main__" and sys.argv[1:2] == ['codecs']:
+    # python benchmark.py codecs <files or folders>
+    file_names = []
+    for path in sys.argv[2:] or ['res']:
+        if os.path.isdir(path):
+            file_names.extend(sorted(
+                os.path.join(path, file_name)
+                for file_name in os.listdir(path)
+                if os.path.isfile(os.path.join(path, file_name))))
+        else:
+            file_names.append(path)
+    codec_rows = compare_codecs(file_names)
+    print_codec_matrix(codec_rows)
+    for file_type, codec_name in sorted(best_codecs(codec_rows).items()):
+        print(f'Fastest lossless codec for {file_type}: {codec_name}')
+elif __name__ == "__main__" and sys.argv[1:2] == ['importtime']:
+    # python benchmark.py importtime [budget ms]
+    sys.exit(benchmark_import_time(
+        budget_ms=float(sys.argv[2]) if len(sys.argv) > 2
+        else IMPORT_BUDGET_MS))
+elif __name__ == "__main__":
+    if len(sys.argv) > 1:
+        flif_file_name = sys.argv[1]
+    else:
+        # a tall RGB image exercises both the row loop and the RGBA strip
+        flif_file_name = os.path.join('output', 'benchmark.flif')
+        rng = np.random.default_rng(0)
+        write_flif(flif_file_name,
+                   rng.integers(0, 256, (4096, 512, 3), dtype=np.uint8))
+    benchmark_get_image(flif_file_name)
@@ -0,0 +1,115 @@
+import sys
+
+import numpy as np
+from PIL import Image
+
+# PIL raw modes that map 1:1 onto a NumPy array FlifEncoderImage accepts
+RAW_LAYOUTS = {
+    'L': (np.uint8, 1),
+    'RGB': (np.uint8, 3),
+    'RGBA': (np.uint8, 4),
+    'I;16' if sys.byteorder == 'little' else 'I;16B': (np.uint16, 1),
+    'I;16N': (np.uint16, 1),
+}
+
+
+def raw_strip_layout(tile, width):
+    """(dtype, channels, row size) of a full-width raw strip, or None.
+
+    tile is an entry of PIL's image.tile; None means PIL has to decode it.
+    """
+    decoder, (x0, _, x1, _), _, args = tile
+    rawmode = args[0] if isinstance(args, tuple) else args
+    stride = args[1] if isinstance(args, tuple) and len(args) > 1 else 0
+    orientation = args[2] if isinstance(args, tuple) and len(args) > 2 else 1
+    if decoder != 'raw' or rawmode not in RAW_LAYOUTS or \
+            (x0, x1) != (0, width) or orientation != 1:
+        return None
+    dtype, channels = RAW_LAYOUTS[rawmode]
+    row_size = stride or width * channels * np.dtype(dtype).itemsize
+    return dtype, channels, row_size
+
+
+def map_raw_image(input_file_name):
+    """Return an np.memmap over an uncompressed image's pixels, or None.
+
+    Works when PIL reports the pixels as raw strips laid out back to back
+    in a layout from RAW_LAYOUTS (e.g. uncompressed TIFF), so nothing is
+    read until the encoder touches it.
+    """
+    with Image.open(input_file_name) as image:
+        width, height = image.size
+        tiles = sorted(image.tile, key=lambda tile: tile[1][1])
+
+    if not tiles:
+        return None
+    layout = raw_strip_layout(tiles[0], width)
+    if layout is None:
+        return None
+    dtype, channels, row_size = layout
+    if row_size != width * channels * np.dtype(dtype).itemsize:
+        return None
+
+    _, _, offset, args = tiles[0]
+    for tile in tiles:
+        _, (_, y0, _, _), tile_offset, tile_args = tile
+        if tile_args != args or raw_strip_layout(tile, width) is None or \
+                tile_offset != offset + y0 * row_size:
+            return None
+
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    return np.memmap(input_file_name, dtype=dtype, mode='r', offset=offset,
+                     shape=shape)
+
+
+# PIL modes libflif has no importer for, and what to convert them to
+CONVERTED_MODES = {
+    '1': 'L',
+    'LA': 'RGBA',
+    'PA': 'RGBA',
+    'RGBX': 'RGB',
+    'RGBa': 'RGBA',
+    'La': 'RGBA',
+    'CMYK': 'RGB',
+    'YCbCr': 'RGB',
+    'LAB': 'RGB',
+    'HSV': 'RGB',
+}
+
+
+def decode_image_array(image):
+    """Convert a PIL image to an array FlifEncoderImage can import.
+
+    Gray, RGB and RGBA stay 8-bit; 16-bit gray stays 16-bit in native
+    byte order. np.asarray makes the only copy (out of PIL's storage);
+    later steps reuse that buffer.
+    """
+    mode = image.mode
+    if mode == 'P':
+        mode = 'RGBA' if 'transparency' in image.info else 'RGB'
+        image = image.convert(mode)
+    elif mode in CONVERTED_MODES:
+        image = image.convert(CONVERTED_MODES[mode])
+    elif mode == 'I':
+        # 32-bit integer pixels, used by PIL for some 16-bit files
+        image_array = np.asarray(image)
+        if image_array.min() < 0 or image_array.max() > 0xFFFF:
+            raise ValueError('32-bit integer image does not fit in 16 bits')
+        return image_array.astype(np.uint16)
+    elif mode not in ('L', 'RGB', 'RGBA') and not mode.startswith('I;16'):
+        raise ValueError(f'Unsupported image mode {mode!r}')
+
+    image_array = np.asarray(image)
+    if image_array.dtype.itemsize == 2:
+        # I;16B and friends come out big-endian; libflif reads native
+        image_array = image_array.astype(np.uint16, copy=False)
+    return image_array
+
+
+def load_image_array(input_file_name):
+    """Pixels of an image as a NumPy array, memory-mapped when possible."""
+    image_array = map_raw_image(input_file_name)
+    if image_array is None:
+        with Image.open(input_file_name) as image:
+            image_array = decode_image_array(image)
+    return image_array
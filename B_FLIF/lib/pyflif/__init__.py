@@ -1,9 +1,11 @@
-from pyflif.flif_convenience import write_flif, read_flif, imwrite, imread
+from pyflif.flif_convenience import PRESETS, register_preset, load_presets, write_flif, write_flif_sequence, read_flif, read_flif_thumbnail, encode_to_bytes, decode_from_bytes, imwrite, imread
 from pyflif.flif_image_decoding import FlifDecoderImage, FlifDecoder
 from pyflif.flif_image_encoding import FlifEncoderImage, FlifEncoder
 
 __all__ = [
-    "write_flif", "read_flif",
+    "PRESETS", "register_preset", "load_presets",
+    "write_flif", "write_flif_sequence", "read_flif", "read_flif_thumbnail",
+    "encode_to_bytes", "decode_from_bytes",
     "imread", "imwrite",
     "FlifEncoderImage", "FlifEncoder",
     "FlifDecoderImage", "FlifDecoder"
@@ -1,43 +1,167 @@
+import itertools
+import json
 import os.path
+import time
 
 from pyflif.flif_image_decoding import FlifDecoder
-from pyflif.flif_image_encoding import FlifEncoder
+from pyflif.flif_image_encoding import FlifEncoder, FlifEncoderImage
 
-try:
-    import scipy.misc
+# (reader, writer) for non-FLIF files, resolved by generic_backend()
+_generic_backend = None
 
-    generic_img_reader = lambda path: scipy.misc.imread(path)
-    generic_img_writer = lambda path, img: scipy.misc.imsave(path, img)
-except ImportError:
-    try:
-        import cv2
+__all__ = ["PRESETS", "register_preset", "load_presets", "write_flif", "write_flif_sequence", "read_flif", "read_flif_thumbnail", "encode_to_bytes", "decode_from_bytes", "imwrite", "imread"]
+
+
+# named FlifEncoder settings, e.g. tuned by autotune.py
+PRESETS = {"default": {}}
+
+# where autotune.py saves presets; read on the first unknown preset name
+PRESETS_FILE = "flif_presets.json"
+
+
+def register_preset(name, **encoder_options):
+    PRESETS[name] = encoder_options
+
+
+def load_presets(presets_filename=PRESETS_FILE):
+    """Register the presets saved in presets_filename; return them."""
+    if not os.path.exists(presets_filename):
+        return {}
+    with open(presets_filename) as file:
+        presets = json.load(file)
+    for name, options in presets.items():
+        register_preset(name, **options)
+    return presets
 
-        generic_img_reader = lambda path: cv2.imread(path)
-        generic_img_writer = lambda path, img: cv2.imwrite(path, img)
-    except ImportError:
-        generic_img_reader = None
-        generic_img_writer = None
 
-__all__ = ["write_flif", "read_flif", "imwrite", "imread"]
+def preset_options(preset, encoder_options):
+    """encoder_options on top of the named preset's options."""
+    if preset is None:
+        return encoder_options
+    if preset not in PRESETS:
+        load_presets()
+    if preset not in PRESETS:
+        raise ValueError("Unknown FLIF preset %r" % preset)
+    options = dict(PRESETS[preset])
+    options.update(encoder_options)
+    return options
 
 
-def write_flif(path, img):
-    with FlifEncoder(path) as enc:
+def write_flif(path, img, preset=None, **encoder_options):
+    with FlifEncoder(path, **preset_options(preset, encoder_options)) as enc:
         return enc.add_image(img)
 
 
-def read_flif(path):
+def write_flif_sequence(path, frames, preset=None, progress=None, **encoder_options):
+    """Encode an iterable of equally shaped frames as one multi-frame FLIF.
+
+    frames may be a generator: every frame is imported and moved into
+    libflif before the next one is pulled, so Python holds one frame at a
+    time (libflif keeps its own copy of all frames until the file is
+    written). progress(frame_count, frame_bytes, elapsed) is called after
+    each frame. Returns frame count, bytes, seconds, frames/s and MB/s.
+    """
+    frames = iter(frames)
+    first_frame = next(frames, None)
+    if first_frame is None:
+        # libflif would only fail once the file is written, with an IOError
+        raise ValueError("no frames")
+    frames = itertools.chain((first_frame,), frames)
+    del first_frame
+
+    start = time.perf_counter()
+    frame_count = frame_bytes = 0
+    shape = None
+
+    with FlifEncoder(path, **preset_options(preset, encoder_options)) as enc:
+        for frame in frames:
+            if shape is None:
+                shape = (frame.shape, frame.dtype)
+            elif (frame.shape, frame.dtype) != shape:
+                raise ValueError("Frame %d is %r %s, expected %r %s" % (
+                    frame_count, frame.shape, frame.dtype, shape[0], shape[1]))
+
+            with FlifEncoderImage(frame) as image:
+                enc.move_image(image)
+            frame_count += 1
+            frame_bytes += frame.nbytes
+            del frame, image
+
+            if progress is not None:
+                progress(frame_count, frame_bytes, time.perf_counter() - start)
+        add_seconds = time.perf_counter() - start
+
+    seconds = time.perf_counter() - start
+    return {
+        "frames": frame_count,
+        "bytes": frame_bytes,
+        "add_seconds": add_seconds,
+        "encode_seconds": seconds - add_seconds,
+        "seconds": seconds,
+        "frames_per_second": frame_count / seconds if seconds else 0.0,
+        "mb_per_second": frame_bytes / seconds / 1e6 if seconds else 0.0,
+    }
+
+
+def read_flif(path, index=0):
     with FlifDecoder(path) as dec:
+        return dec.get_image(index)
+
+
+def read_flif_thumbnail(path, max_side):
+    """Frame 0 scaled to fit max_side x max_side.
+
+    For interlaced files libflif stops reading once the requested size is
+    reached, so only a prefix of the file is decoded.
+    """
+    with FlifDecoder(path, cache_size=0, fit=(max_side, max_side)) as dec:
+        return dec.get_image(0)
+
+
+def encode_to_bytes(img, preset=None, **encoder_options):
+    with FlifEncoder(None, **preset_options(preset, encoder_options)) as enc:
+        enc.add_image(img)
+    return enc.data
+
+
+def decode_from_bytes(data):
+    with FlifDecoder(data=data) as dec:
         return dec.get_image(0)
 
 
+def generic_backend():
+    """(reader, writer) of the first installed backend, or (None, None).
+
+    Importing scipy or cv2 is slow, so it happens on the first non-FLIF
+    imread/imwrite instead of at import time.
+    """
+    global _generic_backend
+    if _generic_backend is not None:
+        return _generic_backend
+
+    try:
+        import scipy.misc
+
+        # imread/imsave were removed from scipy.misc in SciPy 1.2
+        _generic_backend = (scipy.misc.imread, scipy.misc.imsave)
+    except (ImportError, AttributeError):
+        try:
+            import cv2
+
+            _generic_backend = (cv2.imread, cv2.imwrite)
+        except ImportError:
+            _generic_backend = (None, None)
+
+    return _generic_backend
+
+
 def imwrite(path, img):
     ext = os.path.splitext(path)[1]
 
     if ".flif" == ext.lower():
         return write_flif(path, img)
-    elif generic_img_reader is not None:
-        return generic_img_writer(path, img)
+    elif generic_backend()[1] is not None:
+        return generic_backend()[1](path, img)
     else:
         raise IOError("%r is not a FLIF file" % path)
 
@@ -47,7 +171,7 @@ def imread(path):
 
     if ".flif" == ext.lower():
         return read_flif(path)
-    elif generic_img_reader is not None:
-        return generic_img_reader(path)
+    elif generic_backend()[0] is not None:
+        return generic_backend()[0](path)
     else:
         raise IOError("%r is not a FLIF file" % path)
@@ -1,9 +1,9 @@
-import ctypes as ct
 import logging
+from collections import OrderedDict
 
 import numpy as np
 
-from pyflif.flif_wrapper_common import FlifImageBase, FlifDecoderBase
+from pyflif.flif_wrapper_common import FlifImageBase, FlifDecoderBase, FlifCallback, load_libflif
 
 __all__ = ["FlifDecoderImage", "FlifDecoder"]
 
@@ -39,6 +39,7 @@ class FlifDecoderImage(FlifImageBase):
     mImgShape = None
 
     def __init__(self, flif_image_handle):
+        load_libflif()
         self.flif_image_handle = flif_image_handle
 
         if 0 != self.palette_size:
@@ -55,45 +56,110 @@ class FlifDecoderImage(FlifImageBase):
 
         if 8 == self.depth:
             self.dtype = dtype[0]
-            row_reader = row_reader[0]
+            self.row_reader = row_reader[0]
         elif 16 == self.depth:
             self.dtype = dtype[1]
-            row_reader = row_reader[1]
+            self.row_reader = row_reader[1]
         else:
             assert False  # depth should be always 8 or 16
 
-        self.row_reader = lambda row_idx, buffer, buf_size: \
-            row_reader(self.flif_image_handle, row_idx, buffer, buf_size)
-
-    def get_image(self):
-        aux_shape = (self.mImgShape[0], np.prod(self.mImgShape[1:]))
-
-        npy_img = np.zeros(aux_shape, dtype=self.dtype)
-        assert npy_img.flags['C_CONTIGUOUS']
-
-        img_pointer = npy_img.ctypes.data_as(ct.c_void_p)
-
-        for row_idx in range(npy_img.shape[0]):
-            self.row_reader(row_idx, img_pointer, npy_img.strides[0])
-            img_pointer.value += npy_img.strides[0]  # jump to next row (strides in bytes)
-
-        npy_img = npy_img.reshape(self.mImgShape)
-
+    @property
+    def shape(self):
+        """Shape of the array returned by get_image."""
         if (1 < self.nb_channels) and (4 != self.nb_channels):
-            npy_img = npy_img[:, :, :self.nb_channels]
+            return self.mImgShape[:2] + (self.nb_channels,)
+        return self.mImgShape
+
+    def get_image(self, out=None, rows=None):
+        """Decode all rows into a new array, or into out if given.
+
+        rows is an optional slice selecting the rows to decode, e.g.
+        slice(0, 64) for a preview strip; the other rows are never read.
+        out must be a C-contiguous array of the right shape and dtype.
+        """
+        row_indices = range(self.mImgShape[0])
+        if rows is not None:
+            row_indices = row_indices[rows]
+
+        shape = (len(row_indices),) + self.shape[1:]
+        if out is None:
+            out = np.empty(shape, dtype=self.dtype)
+        elif out.shape != shape or out.dtype != self.dtype or not out.flags['C_CONTIGUOUS']:
+            raise ValueError("out must be a C-contiguous %s array of shape %r" % (np.dtype(self.dtype).name, shape))
+
+        handle = self.flif_image_handle
+        row_reader = self.row_reader
+
+        if shape[1:] == self.mImgShape[1:]:
+            # libflif writes straight into the output rows
+            row_size = out.strides[0]
+            address = out.ctypes.data
+            for row_idx in row_indices:
+                row_reader(handle, row_idx, address, row_size)
+                address += row_size
+        else:
+            # RGBA rows are decoded into one scratch row and stripped on copy
+            row = np.empty(self.mImgShape[1:], dtype=self.dtype)
+            row_address = row.ctypes.data
+            row_size = row.nbytes
+            channels = shape[2]
+            for out_idx, row_idx in enumerate(row_indices):
+                row_reader(handle, row_idx, row_address, row_size)
+                out[out_idx] = row[:, :channels]
 
-        return npy_img
+        return out
 
 
 class FlifDecoder(FlifDecoderBase):
     # Object members
     flif_decoder_handle = None
     mFname = None
-
-    def __init__(self, fname):
-        self.mFname = fname
+    mData = None
+    mFrameCache = None
+    mCacheSize = None
+
+    quality = None
+    scale = None
+    resize = None
+    fit = None
+    callback = None
+    first_callback_quality = None
+    mCallback = None
+
+    def __init__(self, fname=None, data=None, cache_size=4, quality=100, scale=1, resize=None, fit=None,
+                 callback=None, first_callback_quality=None):
+        """Decode the FLIF file fname, or the FLIF bytes-like object data.
+
+        The file is decoded once on __enter__. Frames are then converted to
+        arrays on demand; the last cache_size of them are kept, see frames().
+
+        Interlaced files can be decoded partially, reading only a prefix:
+        quality stops at 0..100 percent of the data, scale (a power of two)
+        downsamples, resize=(w, h) and fit=(w, h) resize to at most w x h,
+        the latter keeping the aspect ratio.
+        callback(quality, bytes_read, decode_over) is called while decoding,
+        first at first_callback_quality; it returns the quality of the next
+        call, or 0 to stop decoding there.
+        """
+        if (fname is None) == (data is None):
+            raise ValueError("Either fname or data is required")
+        if scale < 1 or scale & (scale - 1):
+            raise ValueError("scale must be a power of two, got %r" % scale)
+        load_libflif()
+
+        self.mFname = fname if fname is not None else "<memory>"
+        self.mData = data
+        self.mFrameCache = OrderedDict()
+        self.mCacheSize = max(0, int(cache_size))
         self.flif_decoder_handle = None
 
+        self.quality = max(0, min(100, int(quality)))
+        self.scale = int(scale)
+        self.resize = resize
+        self.fit = fit
+        self.callback = callback
+        self.first_callback_quality = first_callback_quality
+
     def __enter__(self):
         # create decoder
         self.flif_decoder_handle = self.Flif.create_decoder()
@@ -102,25 +168,58 @@ class FlifDecoder(FlifDecoderBase):
         # set CRC check
         self.Flif.set_crc_check(self.flif_decoder_handle, 1)
 
-        # decode file
-        if 0 == self.Flif.decode_file(self.flif_decoder_handle, self.mFname.encode('utf-8')):
+        self.set_options()
+
+        # decode file, or the buffer in place without copying it
+        if self.mData is not None:
+            buffer = np.frombuffer(self.mData, dtype=np.uint8)
+            retval = self.Flif.decode_memory(self.flif_decoder_handle, buffer.ctypes.data, buffer.nbytes)
+        else:
+            retval = self.Flif.decode_file(self.flif_decoder_handle, self.mFname.encode('utf-8'))
+
+        if 0 == retval:
             raise IOError("Error decoding FLIF file %r" % self.mFname)
 
         Logger.debug("Decoded FLIF file %r", self.mFname)
 
         return self
 
+    def set_options(self):
+        handle = self.flif_decoder_handle
+
+        self.Flif.set_quality(handle, self.quality)
+        self.Flif.set_scale(handle, self.scale)
+        if self.resize is not None:
+            self.Flif.set_resize(handle, *self.resize)
+        if self.fit is not None:
+            self.Flif.set_fit(handle, *self.fit)
+
+        if self.callback is not None:
+            callback = self.callback
+
+            def progress(quality, bytes_read, decode_over, user_data, context):
+                return int(callback(quality, bytes_read, bool(decode_over)))
+
+            # keep a reference: libflif calls it for as long as the decoder lives
+            self.mCallback = FlifCallback(progress)
+            self.Flif.set_callback(handle, self.mCallback, None)
+            if self.first_callback_quality is not None:
+                self.Flif.set_first_callback_quality(handle, self.first_callback_quality)
+
     def __exit__(self, exc_type, exc_value, traceback):
+        self.mFrameCache.clear()
         if self.flif_decoder_handle is not None:
             self.Flif.destroy_decoder(self.flif_decoder_handle)
             self.flif_decoder_handle = None
+        self.mCallback = None
 
     def num_images(self):
         if self.flif_decoder_handle is None:
             raise IOError("FLIF file %r not (yet) decoded" % self.mFname)
         return self.Flif.num_images(self.flif_decoder_handle)
 
-    def get_image(self, index):
+    def image_info(self, index=0):
+        """FlifDecoderImage of a frame, for metadata without reading pixels."""
         if index >= self.num_images():
             raise ValueError("Frame index %d out of %d requested" % (index, self.num_images()))
 
@@ -130,4 +229,56 @@ class FlifDecoder(FlifDecoderBase):
         if flif_image_handle is None:
             raise IOError("Error reading image %d" % index)
 
-        return FlifDecoderImage(flif_image_handle).get_image()
+        return FlifDecoderImage(flif_image_handle)
+
+    @property
+    def width(self):
+        return self.image_info().width
+
+    @property
+    def height(self):
+        return self.image_info().height
+
+    @property
+    def depth(self):
+        return self.image_info().depth
+
+    @property
+    def nb_channels(self):
+        return self.image_info().nb_channels
+
+    def get_image(self, index, out=None, rows=None):
+        """Decode frame index into a new array, or into out if given.
+
+        rows is an optional slice of rows to decode, see FlifDecoderImage.
+        """
+        return self.image_info(index).get_image(out, rows)
+
+    def __len__(self):
+        return self.num_images()
+
+    def __getitem__(self, index):
+        """Frame index as a read-only array, served from the LRU cache."""
+        num_images = self.num_images()
+        if index < 0:
+            index += num_images
+        if not 0 <= index < num_images:
+            raise IndexError("Frame index %d out of %d requested" % (index, num_images))
+
+        cache = self.mFrameCache
+        if index in cache:
+            cache.move_to_end(index)
+            return cache[index]
+
+        frame = self.get_image(index)
+        frame.flags.writeable = False
+        if self.mCacheSize:
+            cache[index] = frame
+            while len(cache) > self.mCacheSize:
+                cache.popitem(last=False)
+        return frame
+
+    def frames(self):
+        """Iterate over the frames, converting each one only when reached."""
+        for index in range(self.num_images()):
+            yield self[index]
@@ -1,9 +1,10 @@
 import ctypes as ct
 import logging
+import os
 
 import numpy as np
 
-from pyflif.flif_wrapper_common import FlifImageBase, FlifEncoderBase
+from pyflif.flif_wrapper_common import FlifImageBase, FlifEncoderBase, load_libflif
 
 __all__ = ["FlifEncoderImage", "FlifEncoder"]
 
@@ -18,6 +19,7 @@ class FlifEncoderImage(FlifImageBase):
     flif_image_handle = None
 
     def __init__(self, np_image):
+        load_libflif()
         self.importer = self.get_flif_importer(np_image)
         self.image = self.correct_image_strides(np_image)
 
@@ -99,6 +101,7 @@ class FlifEncoder(FlifEncoderBase):
     # Object members
     flif_encoder_handle = None
     fname = None
+    data = None
 
     do_crc_check = None
     interlaced = None
@@ -106,7 +109,8 @@ class FlifEncoder(FlifEncoderBase):
     split_threshold = None
     max_loss = None
 
-    def __init__(self, fname, crc_check=True, interlaced=False, learn_repeat=4, split_threshold_factor=12, maxloss=0):
+    def __init__(self, fname=None, crc_check=True, interlaced=False, learn_repeat=4, split_threshold_factor=12, maxloss=0):
+        load_libflif()
         self.fname = fname
 
         self.do_crc_check = int(bool(crc_check))
@@ -129,9 +133,11 @@ class FlifEncoder(FlifEncoderBase):
             self.destroy()
 
     def open(self):
-        # check if file is writable
-        with open(self.fname, "w") as _:
-            pass
+        # check if file is writable, without truncating an existing one
+        if self.fname is not None:
+            target = self.fname if os.path.exists(self.fname) else (os.path.dirname(self.fname) or ".")
+            if not os.access(target, os.W_OK):
+                raise IOError("FLIF file %s is not writable" % self.fname)
 
         self.flif_encoder_handle = self.Flif.create_encoder()
         Logger.debug("Create FLIF encoder %r", self.flif_encoder_handle)
@@ -145,14 +151,30 @@ class FlifEncoder(FlifEncoderBase):
         return self
 
     def close(self):
+        """Encode the added images to fname, or into data without a file name."""
         if self.flif_encoder_handle is not None:
             try:
-                retval = self.Flif.encode_file(self.flif_encoder_handle, self.fname.encode('utf-8'))
-                if 1 != retval:
-                    raise IOError("Error writing FLIF file %s" % self.fname)
+                if self.fname is None:
+                    self.data = self.encode_memory()
+                else:
+                    retval = self.Flif.encode_file(self.flif_encoder_handle, self.fname.encode('utf-8'))
+                    if 1 != retval:
+                        raise IOError("Error writing FLIF file %s" % self.fname)
             finally:
                 self.destroy()
 
+    def encode_memory(self):
+        """Encode the added images and return the FLIF file as bytes."""
+        buffer = ct.c_void_p()
+        size = ct.c_size_t()
+        if 1 != self.Flif.encode_memory(self.flif_encoder_handle, ct.byref(buffer), ct.byref(size)):
+            raise IOError("Error encoding FLIF image to memory")
+
+        try:
+            return ct.string_at(buffer, size.value)
+        finally:
+            self.Flif.free_memory(buffer)
+
     def destroy(self):
         if self.flif_encoder_handle is not None:
             handle = self.flif_encoder_handle
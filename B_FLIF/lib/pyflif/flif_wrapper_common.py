@@ -1,12 +1,17 @@
 import ctypes as ct
 import logging
+import threading
 from ctypes.util import find_library
 
-__all__ = ["FlifImageBase", "FlifEncoderBase", "FlifDecoderBase"]
+__all__ = ["FlifImageBase", "FlifEncoderBase", "FlifDecoderBase", "FlifCallback", "load_libflif"]
 
 Logger = logging.getLogger("FLIF_wrapper_common")
 Logger.setLevel("WARN")
 
+# progressive decoding callback:
+#                         next quality  quality      bytes_read   decode_over  user_data    context
+FlifCallback = ct.CFUNCTYPE(ct.c_uint32, ct.c_uint32, ct.c_int64, ct.c_uint8, ct.c_void_p, ct.c_void_p)
+
 
 def config_call_general(libflif, struct, flif_prefix, name, argtypes=None, restype=None):
     setattr(struct, name, libflif.__getitem__("{}_{}".format(flif_prefix, name)))
@@ -79,6 +84,8 @@ class FlifEncoderBase(object):
         set_lossy = None
 
         encode_file = None
+        encode_memory = None
+        free_memory = None
 
         add_image = None
         add_image_move = None
@@ -96,10 +103,17 @@ class FlifEncoderBase(object):
         struct.destroy_encoder.restype = None
         struct.destroy_encoder.argtypes = [ct.c_void_p]
 
+        # releases the buffer returned by encode_memory
+        struct.free_memory = libflif.flif_free_memory
+        struct.free_memory.restype = None
+        struct.free_memory.argtypes = [ct.c_void_p]
+
         def config_call(name, argtypes=None, restype=None):
             config_call_general(libflif, struct, "flif_encoder", name, argtypes, restype)
 
         config_call("encode_file", [ct.c_void_p, ct.c_char_p], ct.c_int32)
+        #                               encoder      buffer                        size
+        config_call("encode_memory", [ct.c_void_p, ct.POINTER(ct.c_void_p), ct.POINTER(ct.c_size_t)], ct.c_int32)
         config_call("add_image", [ct.c_void_p, ct.c_void_p])
         config_call("add_image_move", [ct.c_void_p, ct.c_void_p])
 
@@ -114,8 +128,16 @@ class FlifDecoderBase(object):
     class Flif(object):
         create_decoder = None
         decode_file = None
+        decode_memory = None
         set_crc_check = None
 
+        set_quality = None
+        set_scale = None
+        set_resize = None
+        set_fit = None
+        set_callback = None
+        set_first_callback_quality = None
+
         num_images = None
         get_image = None
 
@@ -138,8 +160,16 @@ class FlifDecoderBase(object):
             config_call_general(libflif, struct, "flif_decoder", name, argtypes, restype)
 
         config_call("decode_file", [ct.c_void_p, ct.c_char_p], ct.c_int32)
+        config_call("decode_memory", [ct.c_void_p, ct.c_void_p, ct.c_size_t], ct.c_int32)
         config_call("set_crc_check", [ct.c_void_p, ct.c_uint32])
         config_call("num_images", [ct.c_void_p], ct.c_size_t)
+
+        config_call("set_quality", [ct.c_void_p, ct.c_int32])
+        config_call("set_scale", [ct.c_void_p, ct.c_uint32])
+        config_call("set_resize", [ct.c_void_p, ct.c_uint32, ct.c_uint32])
+        config_call("set_fit", [ct.c_void_p, ct.c_uint32, ct.c_uint32])
+        config_call("set_callback", [ct.c_void_p, FlifCallback, ct.c_void_p])
+        config_call("set_first_callback_quality", [ct.c_void_p, ct.c_int32])
         config_call("get_image", [ct.c_void_p, ct.c_size_t], ct.c_void_p)
 
 
@@ -147,15 +177,32 @@ class FlifDecoderBase(object):
 # Loading DLL or shared library file
 
 
-def _load_libflif():
-    libflif_name = find_library('flif')
-    Logger.debug("Loading FLIF library from {}".format(libflif_name))
+_libflif = None
+_libflif_lock = threading.Lock()
+
+
+def load_libflif():
+    """Load libflif and bind its symbols, once, on the first call.
+
+    Encoders and decoders call this when they are created, so importing
+    pyflif stays cheap for code that never touches a FLIF file.
+    """
+    global _libflif
+    if _libflif is not None:
+        return _libflif
 
-    libflif = ct.cdll[libflif_name]
+    with _libflif_lock:
+        if _libflif is None:
+            libflif_name = find_library('flif')
+            if libflif_name is None:
+                raise OSError("FLIF library (libflif) not found")
+            Logger.debug("Loading FLIF library from {}".format(libflif_name))
 
-    FlifEncoderBase.initialize(libflif)
-    FlifImageBase.initialize(libflif)
-    FlifDecoderBase.initialize(libflif)
+            libflif = ct.cdll[libflif_name]
 
+            FlifEncoderBase.initialize(libflif)
+            FlifImageBase.initialize(libflif)
+            FlifDecoderBase.initialize(libflif)
+            _libflif = libflif
 
-_load_libflif()
+    return _libflif
@@ -7,7 +7,18 @@ lib_path = os.path.join(os.path.dirname(__file__), 'lib')
 
 # Add the 'lib' directory to sys.path
 sys.path.append(lib_path)
-from lib.pyflif.flif_convenience import write_flif, read_flif, imwrite, imread
+from pyflif.flif_convenience import write_flif, read_flif, imwrite, imread, \
+    preset_options
+
+# Shared instrumentation (Timer) lives next to the LZW code
+lzw_path = os.path.join(os.path.dirname(__file__), '..', 'A_LZW')
+sys.path.append(lzw_path)
+from Timer import Timer, profiler
+from batch import compress_directory, print_batch_report
+from cache import CompressionCache
+from image_io import RAW_LAYOUTS, map_raw_image, decode_image_array, \
+    load_image_array
+
 
 def check_folder():
     folder_input_path = 'res/'
@@ -16,7 +27,15 @@ def check_folder():
     create_folder(folder_output_path)
 
 
-def print_compression_info(input_file_name, output_file_name):
+def create_output_folder(output_file_name):
+    """Create the folder output_file_name goes in, if it has one."""
+    folder_path = os.path.dirname(output_file_name)
+    if folder_path:
+        os.makedirs(folder_path, exist_ok=True)
+
+
+def print_compression_info(input_file_name, output_file_name,
+                           elapsed_time=None, cached=False):
     original_size = Compression.get_file_size(input_file_name)
     compressed_size = Compression.get_file_size(output_file_name)
     compression_ratio = Compression.calculate_compression_ratio(
@@ -27,30 +46,88 @@ def print_compression_info(input_file_name, output_file_name):
     print(f'Original Size: \t\t{original_size:>8,} \t bytes')
     print(f'Compressed Size: \t{compressed_size:>8,} \t bytes')
     print(f'Compression Ratio: \t{compression_ratio:.4f}')
+    if cached:
+        # the time was spent copying the cached output, not encoding
+        print('Encode Time: \t\tcached')
+    elif elapsed_time is not None:
+        compression_speed = Compression.calculate_compression_speed(
+            original_size, elapsed_time)
+        print(f'Encode Time: \t\t{elapsed_time:.5f} \t seconds')
+        print(f'Compression Speed: \t{compression_speed:,.4f} \t bytes/second')
     print('--------------------------------------------------\n\n')
 
 
-def compress_as_jpeg(input_file_name, output_file_name):
-    check_folder()
-    image = Image.open(input_file_name)
-    image.save(output_file_name, 'JPEG')
+@profiler.timed('jpeg')
+def compress_as_jpeg(input_file_name, output_file_name, cache=None):
+    create_output_folder(output_file_name)
+    if cache is not None:
+        return cache.compress(compress_as_jpeg, input_file_name,
+                              output_file_name, 'jpeg')
+    with profiler.span('decode'):
+        image = Image.open(input_file_name)
+        image.load()
+    with profiler.span('encode'):
+        image.save(output_file_name, 'JPEG')
 
 
-def compress_as_flif(input_file_name, output_file_name):
-    check_folder()
-    with open(input_file_name, 'rb') as image_file:
-        image_data = image_file.read()
+@profiler.timed('flif')
+def compress_as_flif(input_file_name, output_file_name, cache=None,
+                     **encoder_options):
+    create_output_folder(output_file_name)
+    if cache is not None:
+        # key on what a preset stands for, so a re-tuned preset misses
+        options = preset_options(encoder_options.pop('preset', None),
+                                 encoder_options)
+        return cache.compress(
+            lambda input_name, output_name: compress_as_flif(
+                input_name, output_name, **options),
+            input_file_name, output_file_name, 'flif', **options)
+    with profiler.span('read'):
+        image_data = load_image_array(input_file_name)
 
-    write_flif(output_file_name, image_data)
+    with profiler.span('encode'):
+        write_flif(output_file_name, image_data, **encoder_options)
 
 
-if __name__ == "__main__":
+def batch_compress(input_folder, output_folder, codec='flif', workers=None):
+    """Compress every image below input_folder with a thread pool.
+
+    libflif (ctypes) and PIL release the GIL while encoding, so threads
+    scale without the pickling cost of processes.
+    """
+    compress_function, suffix = {
+        'flif': (compress_as_flif, '.flif'),
+        'jpeg': (compress_as_jpeg, '.jpg'),
+    }[codec]
+    report = compress_directory(input_folder, output_folder,
+                                compress_function, suffix, 'thread', workers)
+    print_batch_report(report)
+    return report
+
+
+if __name__ == "__main__" and len(sys.argv) > 2:
+    # python main.py <input folder> <output folder> [flif|jpeg]
+    batch_compress(*sys.argv[1:4])
+elif __name__ == "__main__":
+    check_folder()
+    profiler.enable()
+    cache = CompressionCache()
     folder_input_path = 'res/'
     folder_output_path = 'output/'
     input_file_name = joinPath(folder_input_path, 'file.tiff')
 
+    timer = Timer()
+
     output_jpeg_file_name = joinPath(folder_output_path, "output_file.jpg")
-    compress_as_jpeg(input_file_name, output_jpeg_file_name)
+    timer.start()
+    cached = compress_as_jpeg(input_file_name, output_jpeg_file_name, cache)
+    print_compression_info(input_file_name, output_jpeg_file_name,
+                           timer.stop(), cached)
 
     output_flif_file__name = joinPath(folder_output_path, "output_file.flif")
-    compress_as_flif(input_file_name, output_flif_file__name)
+    timer.start()
+    cached = compress_as_flif(input_file_name, output_flif_file__name, cache)
+    print_compression_info(input_file_name, output_flif_file__name,
+                           timer.stop(), cached)
+
+    profiler.print_summary()
@@ -0,0 +1,198 @@
+import io
+import json
+import os
+import struct
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_io import decode_image_array, raw_strip_layout
+
+lib_path = os.path.join(os.path.dirname(__file__), 'lib')
+sys.path.append(lib_path)
+from pyflif.flif_convenience import encode_to_bytes, decode_from_bytes
+
+lzw_path = os.path.join(os.path.dirname(__file__), '..', 'A_LZW')
+sys.path.append(lzw_path)
+from batch import ordered_map
+
+# manifest offset, manifest length, magic
+TILES_FOOTER = struct.Struct('>QI4s')
+TILES_MAGIC = b'TILX'
+TILES_VERSION = 1
+
+ROWS_PER_TILE = 512
+
+
+def _tile_rows(tile, height):
+    _, (_, y0, _, y1), _, _ = tile
+    return y0, min(y1, height)
+
+
+def tile_bands(input_file_name, rows_per_tile=ROWS_PER_TILE):
+    """Split an image into row bands of about rows_per_tile rows.
+
+    Bands start where the file's strips (or rows of tiles) start, so each
+    one can be decoded on its own; raw strips can be cut at any row.
+    """
+    with Image.open(input_file_name) as image:
+        width, height = image.size
+        cuts = set()
+        for tile in image.tile:
+            y0, y1 = _tile_rows(tile, height)
+            if raw_strip_layout(tile, width) is not None:
+                cuts.update(range(y0, y1))
+            else:
+                cuts.add(y0)
+    cuts = sorted(cut for cut in cuts if 0 < cut < height)
+
+    bands = []
+    start = 0
+    for cut in cuts:
+        if cut - start >= rows_per_tile:
+            bands.append((start, cut))
+            start = cut
+    bands.append((start, height))
+    return bands
+
+
+def read_band(input_file_name, y0, y1):
+    """Decode rows y0:y1 of an image, reading only the strips they cover.
+
+    PIL decodes whatever is listed in image.tile into an image of
+    image.size, so the tile list is narrowed to the band and shifted up.
+    """
+    with Image.open(input_file_name) as image:
+        width, height = image.size
+        tiles = []
+        for tile in image.tile:
+            decoder, (x0, tile_y0, x1, _), offset, args = tile
+            tile_y0, tile_y1 = _tile_rows(tile, height)
+            if tile_y1 <= y0 or tile_y0 >= y1:
+                continue
+            if tile_y0 < y0 or tile_y1 > y1:
+                layout = raw_strip_layout(tile, width)
+                if layout is None:
+                    raise ValueError(f'Rows {y0}:{y1} split an encoded strip')
+                # a raw strip is cut to the band by moving its offset
+                offset += (max(tile_y0, y0) - tile_y0) * layout[2]
+                tile_y0, tile_y1 = max(tile_y0, y0), min(tile_y1, y1)
+            tiles.append((decoder, (x0, tile_y0 - y0, min(x1, width),
+                                    tile_y1 - y0), offset, args))
+
+        image._size = (width, y1 - y0)
+        image.tile = tiles
+        image.load()
+        return image
+
+
+def encode_tile(image, codec):
+    if codec == 'flif':
+        return encode_to_bytes(decode_image_array(image))
+    if image.mode not in ('L', 'RGB', 'CMYK'):
+        image = image.convert('RGB')
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def decode_tile(data, codec):
+    if codec == 'flif':
+        return Image.fromarray(decode_from_bytes(data))
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def _compress_band(arguments):
+    input_file_name, y0, y1, codec = arguments
+    return encode_tile(read_band(input_file_name, y0, y1), codec)
+
+
+def compress_tiled(input_file_name, output_file_name, codec='flif',
+                   rows_per_tile=ROWS_PER_TILE, workers=None):
+    """Encode an image as independently decodable tiles on a thread pool.
+
+    Only the bands being encoded are in memory. libflif and PIL release
+    the GIL while encoding, so threads use every core. The container is
+    the encoded tiles followed by a JSON manifest and a footer.
+    """
+    if codec not in ('flif', 'jpeg'):
+        raise ValueError(f'Unknown tile codec {codec!r}')
+    with Image.open(input_file_name) as image:
+        width, height = image.size
+    bands = tile_bands(input_file_name, rows_per_tile)
+    workers = workers or os.cpu_count()
+
+    tiles = []
+    with ThreadPoolExecutor(workers) as executor, \
+            open(output_file_name, 'wb') as file:
+        tasks = ((input_file_name, y0, y1, codec) for y0, y1 in bands)
+        results = ordered_map(executor, _compress_band, tasks, 2 * workers)
+        for (y0, y1), data in zip(bands, results):
+            tiles.append({'y': y0, 'height': y1 - y0,
+                          'offset': file.tell(), 'length': len(data)})
+            file.write(data)
+
+        manifest = json.dumps({
+            'version': TILES_VERSION,
+            'codec': codec,
+            'width': width,
+            'height': height,
+            'tiles': tiles,
+        }).encode()
+        manifest_offset = file.tell()
+        file.write(manifest)
+        file.write(TILES_FOOTER.pack(manifest_offset, len(manifest),
+                                     TILES_MAGIC))
+    return len(tiles)
+
+
+def read_manifest(file):
+    file.seek(-TILES_FOOTER.size, os.SEEK_END)
+    manifest_offset, manifest_length, magic = TILES_FOOTER.unpack(
+        file.read(TILES_FOOTER.size))
+    if magic != TILES_MAGIC:
+        raise ValueError(f'Not a tile container (magic {magic!r})')
+    file.seek(manifest_offset)
+    manifest = json.loads(file.read(manifest_length))
+    if manifest['version'] != TILES_VERSION:
+        raise ValueError(
+            f'Unsupported tile container version {manifest["version"]}')
+    return manifest
+
+
+def read_tile(file_name, index):
+    """Decode one tile (a PIL image) without touching the others."""
+    with open(file_name, 'rb') as file:
+        manifest = read_manifest(file)
+        tile = manifest['tiles'][index]
+        file.seek(tile['offset'])
+        return decode_tile(file.read(tile['length']), manifest['codec'])
+
+
+def reassemble(file_name, output_file_name=None):
+    """Paste every tile back into one image; optionally save it."""
+    with open(file_name, 'rb') as file:
+        manifest = read_manifest(file)
+        image = None
+        for tile in manifest['tiles']:
+            file.seek(tile['offset'])
+            tile_image = decode_tile(file.read(tile['length']),
+                                     manifest['codec'])
+            if image is None:
+                image = Image.new(tile_image.mode, (manifest['width'],
+                                                    manifest['height']))
+            image.paste(tile_image, (0, tile['y']))
+    if output_file_name is not None:
+        image.save(output_file_name)
+    return image
+
+
+if __name__ == "__main__":
+    # python tiling.py <input image> <output .tiles> [flif|jpeg] [rows]
+    tile_count = compress_tiled(
+        sys.argv[1], sys.argv[2], *sys.argv[3:4],
+        *(int(rows) for rows in sys.argv[4:5]))
+    print(f'{tile_count} tiles written to {sys.argv[2]}')
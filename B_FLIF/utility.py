@@ -1,4 +1,19 @@
+import bz2
+import io
+from abc import ABC, abstractmethod
+import lzma
 import os
+import sys
+import zlib
+
+lib_path = os.path.join(os.path.dirname(__file__), 'lib')
+sys.path.append(lib_path)
+
+# The ratio/speed helpers are shared with the LZW code
+lzw_path = os.path.join(os.path.dirname(__file__), '..', 'A_LZW')
+sys.path.append(lzw_path)
+from metrics import calculate_compression_ratio, calculate_compression_speed, \
+    calculate_decompression_speed
 
 
 def create_folder(folder_path):
@@ -15,31 +30,205 @@ def joinPath(folder_path, file_name):
     return os.path.join(folder_path, file_name)
 
 
-def calculate_compression_ratio(original_size, compressed_size):
-    return compressed_size / original_size
+CHUNK_SIZE = 1 << 20
 
 
-def calculate_compression_speed(original_size, compression_time):
-    return original_size / compression_time
+class Codec(ABC):
+    """One compression method behind compress/decompress/stream calls.
 
+    The default streams read the whole input; streaming codecs override
+    them. Image codecs take an image file and decompress to raw pixels,
+    so they set roundtrips to False.
+    """
+    name = None
+    lossless = True
+    # decompress(compress(data)) == data
+    roundtrips = True
 
-def calculate_decompression_speed(decompressed_size, decompression_time):
-    return decompressed_size / decompression_time
+    @abstractmethod
+    def compress(self, data):
+        pass
 
+    @abstractmethod
+    def decompress(self, data):
+        pass
 
-class Compression:
-    @staticmethod
-    def get_file_size(file_name):
-        return os.path.getsize(file_name)
+    def compress_stream(self, input_file, output_file):
+        output_file.write(self.compress(input_file.read()))
 
-    @staticmethod
-    def calculate_compression_ratio(original_size, compressed_size):
-        return compressed_size / original_size
+    def decompress_stream(self, input_file, output_file):
+        output_file.write(self.decompress(input_file.read()))
+
+
+class StdlibCodec(Codec):
+    """A zlib/bz2/lzma style codec built from compressor objects."""
+
+    def __init__(self, name, compressobj, decompressobj):
+        self.name = name
+        self.compressobj = compressobj
+        self.decompressobj = decompressobj
+
+    def compress(self, data):
+        compressor = self.compressobj()
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data):
+        decompressor = self.decompressobj()
+        return decompressor.decompress(data) + self._finish(decompressor)
 
     @staticmethod
-    def calculate_compression_speed(original_size, compression_time):
-        return original_size / compression_time
+    def _finish(decompressor):
+        # only zlib has a flush; all three flag the end of the stream
+        data = decompressor.flush() if hasattr(decompressor, 'flush') else b''
+        if not decompressor.eof:
+            raise ValueError('Compressed stream is truncated')
+        return data
+
+    def compress_stream(self, input_file, output_file):
+        compressor = self.compressobj()
+        for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            output_file.write(compressor.compress(chunk))
+        output_file.write(compressor.flush())
+
+    def decompress_stream(self, input_file, output_file):
+        decompressor = self.decompressobj()
+        for chunk in iter(lambda: input_file.read(CHUNK_SIZE), b''):
+            output_file.write(decompressor.decompress(chunk))
+        output_file.write(self._finish(decompressor))
+
+
+class LZWCodec(Codec):
+    """The bit-packed .lzw format of A_LZW, streamed in bounded memory."""
+    name = 'lzw'
+
+    def __init__(self, max_bits=12, policy='freeze', huffman=False):
+        self.max_bits = max_bits
+        self.policy = policy
+        self.huffman = huffman
+        if huffman:
+            self.name = 'lzw-huffman'
+
+    def compress(self, data):
+        from lzw_stream import compress_buffer
+
+        output_file = io.BytesIO()
+        compress_buffer(data, output_file, self.max_bits, self.policy,
+                        huffman=self.huffman)
+        return output_file.getvalue()
+
+    def decompress(self, data):
+        from lzw_stream import LZWDecompressor
+
+        decompressor = LZWDecompressor()
+        return decompressor.feed(data) + decompressor.flush()
+
+    def compress_stream(self, input_file, output_file):
+        from lzw_stream import compress_stream
+
+        compress_stream(input_file, output_file, self.max_bits, self.policy,
+                        huffman=self.huffman)
+
+    def decompress_stream(self, input_file, output_file):
+        from lzw_stream import decompress_stream
+
+        decompress_stream(input_file, output_file)
+
+
+class FlifCodec(Codec):
+    """Lossless FLIF via pyflif; libflif is loaded on first use."""
+    name = 'flif'
+    roundtrips = False
+
+    def __init__(self, **encoder_options):
+        self.encoder_options = encoder_options
+
+    def compress(self, data):
+        from PIL import Image
+        from image_io import decode_image_array
+        from pyflif.flif_convenience import encode_to_bytes
+
+        with Image.open(io.BytesIO(data)) as image:
+            image_array = decode_image_array(image)
+        return encode_to_bytes(image_array, **self.encoder_options)
+
+    def decompress(self, data):
+        from pyflif.flif_convenience import decode_from_bytes
+
+        return decode_from_bytes(data).tobytes()
+
+
+class JpegCodec(Codec):
+    name = 'jpeg'
+    lossless = False
+    roundtrips = False
+
+    def __init__(self, quality=75):
+        self.quality = quality
+
+    def compress(self, data):
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as image:
+            if image.mode not in ('L', 'RGB', 'CMYK'):
+                image = image.convert('RGB')
+            output_file = io.BytesIO()
+            image.save(output_file, 'JPEG', quality=self.quality)
+        return output_file.getvalue()
+
+    def decompress(self, data):
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as image:
+            return image.tobytes()
+
+
+class Compression:
+    # codec name -> Codec, see register()
+    codecs = {}
+
+    @classmethod
+    def register(cls, codec):
+        cls.codecs[codec.name] = codec
+        return codec
+
+    @classmethod
+    def get_codec(cls, name):
+        if name not in cls.codecs:
+            raise ValueError(f'Unknown codec {name!r}')
+        return cls.codecs[name]
+
+    @classmethod
+    def compress(cls, name, data):
+        return cls.get_codec(name).compress(data)
+
+    @classmethod
+    def decompress(cls, name, data):
+        return cls.get_codec(name).decompress(data)
+
+    @classmethod
+    def compress_stream(cls, name, input_file, output_file):
+        cls.get_codec(name).compress_stream(input_file, output_file)
+
+    @classmethod
+    def decompress_stream(cls, name, input_file, output_file):
+        cls.get_codec(name).decompress_stream(input_file, output_file)
 
     @staticmethod
-    def calculate_decompression_speed(decompressed_size, decompression_time):
-        return decompressed_size / decompression_time
+    def get_file_size(file_name):
+        return os.path.getsize(file_name)
+
+    calculate_compression_ratio = staticmethod(calculate_compression_ratio)
+    calculate_compression_speed = staticmethod(calculate_compression_speed)
+    calculate_decompression_speed = staticmethod(
+        calculate_decompression_speed)
+
+
+Compression.register(LZWCodec())
+Compression.register(LZWCodec(huffman=True))
+Compression.register(FlifCodec())
+Compression.register(JpegCodec())
+Compression.register(StdlibCodec('zlib', zlib.compressobj, zlib.decompressobj))
+Compression.register(StdlibCodec('bz2', bz2.BZ2Compressor,
+                                 bz2.BZ2Decompressor))
+Compression.register(StdlibCodec('lzma', lzma.LZMACompressor,
+                                 lzma.LZMADecompressor))